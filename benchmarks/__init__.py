@@ -0,0 +1,9 @@
+''' Benchmarks for Slate.
+    
+    Each module in this package is a script which can be run from the root
+    of the repository, like so::
+        
+        python -m benchmarks.bindings
+'''
+
+# EOF
@@ -0,0 +1,68 @@
+''' benchmarks.bindings
+    Time how long it takes to find the bindings for an event.
+    
+    Compares ``Ruleset.select``, which looks bindings up in an index, with
+    checking every binding with ``match``, at 10, 100 and 1000 bindings.
+    Each binding is for a different channel, so only one of them matches.
+    Also times building the index with ``Ruleset.index``. Run with::
+        
+        python -m benchmarks.bindings
+'''
+
+import sys
+import timeit
+
+from reflex.data import Event
+from reflex.control import EventManager
+
+
+SIZES = (10, 100, 1000)
+
+
+def handler(data, *args):
+    pass
+
+
+def setup(size):
+    """ Return a ruleset with ``size`` bindings, and an event for it. """
+    events = EventManager()
+    
+    for i in range(size):
+        events.bind(handler, 'recv_msg', ns='chat:channel{0}'.format(i))
+    
+    ruleset = events.rules['default']
+    event = Event('recv_msg', [('ns', 'chat:channel{0}'.format(size // 2)), ('user', 'someone')])
+    return ruleset, event
+
+
+def best(func, number):
+    """ Return the fastest time for one call of ``func``, in microseconds. """
+    return min(timeit.repeat(func, repeat=5, number=number)) / number * 1e6
+
+
+def main(number=2000):
+    print('{0:>8} {1:>12} {2:>12} {3:>12}'.format('bindings', 'select', 'match all', 'index'))
+    
+    for size in SIZES:
+        ruleset, event = setup(size)
+        snapshot = ruleset.mapref['recv_msg'].snapshot()
+        
+        def select():
+            ruleset.select(event)
+        
+        def match():
+            [binding for binding in snapshot if binding.match(event)]
+        
+        def index():
+            ruleset.index(snapshot)
+        
+        assert len(ruleset.select(event)) == 1
+        
+        print('{0:>8} {1:>10.2f}us {2:>10.2f}us {3:>10.2f}us'.format(size,
+            best(select, number), best(match, number // 10 or 1), best(index, number // 10 or 1)))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
+
+# EOF
@@ -0,0 +1,91 @@
+''' benchmarks.packets
+    Time how long the client takes to handle packets.
+    
+    Compares finding a packet's ``pkt_*`` handler in the client's handler
+    table with building the method name and using ``getattr``, which is
+    what ``handle_pkt`` did before the table was added. Also times
+    ``pkt_generic`` and the whole of ``handle_pkt`` for a few packets,
+    with and without anything bound to their events. Run with::
+        
+        python -m benchmarks.packets
+'''
+
+import sys
+import timeit
+
+from reflex.control import EventManager
+from dAmnViper.parse import Packet
+from slate.custom import Client
+
+
+PACKETS = {
+    'recv_msg': 'recv chat:Botdom\n\nmsg main\nfrom=someone\n\nhello there',
+    'recv_join': 'recv chat:Botdom\n\njoin someone\ns=1\n\nsymbol=~\nrealname=Someone\ngpc=guest',
+    'recv_part': 'recv chat:Botdom\n\npart someone\n\n',
+}
+
+
+def handler(data, *args):
+    pass
+
+
+def quiet(*args, **kwargs):
+    pass
+
+
+def client(bound):
+    """ Return a client, with ``handler`` bound to every event if
+        ``bound`` is true.
+    """
+    events = EventManager()
+    
+    if bound:
+        for name in PACKETS:
+            events.bind(handler, name)
+    
+    dAmn = Client(stdout=quiet, stddebug=quiet, _events=events, _teardown=quiet)
+    dAmn.handle_pkt(Packet('join chat:Botdom\ne=ok\n\n'), 0)
+    return dAmn
+
+
+def best(func, number):
+    """ Return the fastest time for one call of ``func``, in microseconds. """
+    return min(timeit.repeat(func, repeat=5, number=number)) / number * 1e6
+
+
+def main(number=20000):
+    idle = client(False)
+    busy = client(True)
+    
+    print('{0:>10} {1:>10} {2:>10} {3:>12} {4:>12} {5:>12}'.format(
+        'event', 'table', 'getattr', 'generic', 'handle_pkt', 'with bound'))
+    
+    for name, raw in sorted(PACKETS.items()):
+        packet = Packet(raw)
+        event = idle.protocol.mapper(packet)
+        assert event.name == name
+        
+        def table():
+            idle.handlers.get(event.name, idle.pkt_unknown)
+        
+        def lookup():
+            getattr(idle, 'pkt_' + event.name, idle.pkt_unknown)
+        
+        def generic():
+            idle.pkt_generic(event)
+        
+        def unbound():
+            idle.handle_pkt(packet, 0)
+        
+        def bound():
+            busy.handle_pkt(packet, 0)
+        
+        print('{0:>10} {1:>8.2f}us {2:>8.2f}us {3:>10.2f}us {4:>10.2f}us {5:>10.2f}us'.format(name,
+            best(table, number), best(lookup, number), best(generic, number),
+            best(unbound, number // 10), best(bound, number // 10)))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
+
+# EOF
@@ -0,0 +1,53 @@
+''' benchmarks.startup
+    Time how long it takes to import the bot.
+    
+    Imports a module, ``slate.core`` by default, in a new interpreter a few
+    times, and reports how long the import took, how many modules were
+    loaded, how many of them were from ``twisted.web``, and the peak
+    memory use of the process. Run with::
+        
+        python -m benchmarks.startup [module] [runs]
+'''
+
+import sys
+import json
+import subprocess
+
+
+CHILD = '''
+import sys, json, time, resource
+start = time.time()
+__import__({0!r})
+elapsed = time.time() - start
+modules = [name for name, module in sys.modules.items() if module is not None]
+sys.stdout.write(json.dumps({{
+    'time': elapsed,
+    'modules': len(modules),
+    'web': len([name for name in modules if name.startswith('twisted.web')]),
+    'rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+}}))
+'''
+
+
+def measure(module):
+    """ Import a module in a new interpreter, and return its numbers. """
+    output = subprocess.check_output([sys.executable, '-c', CHILD.format(module)])
+    return json.loads(output)
+
+
+def main(module='slate.core', runs=5):
+    results = [measure(module) for i in range(int(runs))]
+    times = sorted([result['time'] * 1000 for result in results])
+    last = results[-1]
+    
+    print('import {0}, {1} runs'.format(module, len(results)))
+    print('time:    {0:.0f}ms best, {1:.0f}ms median, {2:.0f}ms worst'.format(
+        times[0], times[len(times) // 2], times[-1]))
+    print('modules: {0} ({1} from twisted.web)'.format(last['modules'], last['web']))
+    print('peak:    {0:.1f} MB'.format(last['rss'] / 1024.0))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:3])
+
+# EOF
@@ -16,6 +16,7 @@ from functools import wraps
 # Twisted imports. Wooooo.
 from twisted.internet import defer
 from twisted.internet import reactor
+from twisted.python import threadable
 
 
 # Viper imports
@@ -23,9 +24,12 @@ from twisted.internet import reactor
 from dAmnViper.data import Channel
 # Parsing
 from dAmnViper.parse import Packet
+from dAmnViper.parse import PacketEvent
 from dAmnViper.parse import ProtocolParser
 # Internets! lols.
 from dAmnViper.net import ConnectionFactory
+# Scheduling
+from dAmnViper.tasks import Scheduler
 
 
 class IChatClient(object):
@@ -248,6 +252,39 @@ class ChatClient(IChatClient):
                 pass
     
     
+    class Namespaces(object):
+        """ Cache of namespace conversions.
+            
+            Conversions depend on the client's username, so the cache is
+            emptied whenever the username changes. Once a table holds
+            ``limit`` entries it is emptied before anything else is stored.
+        """
+        
+        def __init__(self, limit=512):
+            self.limit = limit
+            self.username = None
+            self.formatted = {}
+            self.deformed = {}
+        
+        def check(self, username):
+            """ Empty the cache if the username has changed. """
+            if username == self.username:
+                return
+            
+            self.username = username
+            self.formatted = {}
+            self.deformed = {}
+        
+        def store(self, table, ns, value):
+            """ Store a conversion in the given table. """
+            if len(table) >= self.limit:
+                table.clear()
+            
+            value = intern(value)
+            table[intern(ns)] = value
+            return value
+    
+    
     extras = {'remember_me':'1'}
     agent = 'dAmnViper (python) dAmnSock/1.1'
     info = {}
@@ -256,12 +293,17 @@ class ChatClient(IChatClient):
     io = None
     
     Protocol = ProtocolParser
+    Scheduler = Scheduler
     
     autojoin = ['chat:Botdom']
     default_ns = '~Global'
     timeout_delay = 120
+    history_size = 0
+    history_limit = 10000
     channel = {}
     stdout = None
+    timer = None
+    handler_cache = {}
     
 
     def __init__(self, stdout=None, *args, **kwargs):
@@ -290,6 +332,35 @@ class ChatClient(IChatClient):
         self.connection = self.Connection()
         self.defer = self.Defer()
         self.protocol = self.Protocol()
+        self.nscache = self.Namespaces()
+        self.scheduler = self.Scheduler(stdout=self.new_logger(showns=False))
+        self.build_handlers()
+    
+    def build_handlers(self, rebuild=False):
+        """ Build the table used to dispatch events to ``pkt_*`` methods.
+            
+            The names of the methods used for each event are worked out once
+            for each client class and stored in ``handler_cache``. Each client
+            object then stores its own bound methods in ``handlers``, so that
+            ``handle_pkt`` only has to do a single lookup for each packet.
+            
+            If ``pkt_*`` methods are added or replaced after the client has
+            been created, call this method with ``rebuild=True`` to make sure
+            the new methods are used.
+        """
+        cls = self.__class__
+        
+        if rebuild or not cls in ChatClient.handler_cache:
+            names = {}
+            
+            for name in self.protocol.maps:
+                names[name] = 'pkt_' + name if hasattr(cls, 'pkt_' + name) else 'pkt_unknown'
+            
+            ChatClient.handler_cache[cls] = names
+        
+        self.handlers = dict([
+            (name, getattr(self, method)) for name, method in ChatClient.handler_cache[cls].iteritems()
+        ])
     
     def nullflags(self):
         """ Reset all status flags in this client. """
@@ -311,8 +382,12 @@ class ChatClient(IChatClient):
         # Open a connection to the server.
         self.makeConnection()
         
-        # Set up the client's main loop.
-        self.defer.loop = reactor.callLater(1, self.mainloop, args, kwargs)
+        # Start running scheduled tasks.
+        self.scheduler.start()
+        
+        # Set up the client's main loop, if anything uses it.
+        if getattr(self.on_loop, '__func__', None) is not ChatClient.on_loop.__func__:
+            self.defer.loop = self.scheduler.call_every(1, self.mainloop, args, kwargs)
         
         # Allow subclasses to do whatever
         self.on_client_start(*args, **kwargs)
@@ -401,6 +476,7 @@ class ChatClient(IChatClient):
             return
         
         self.defer.teardown()
+        self.scheduler.stop()
         try:
             self.teardown()
         except Exception as e:
@@ -434,12 +510,19 @@ class ChatClient(IChatClient):
         pass
     
     def mainloop(self, args, kwargs):
-        """ This is the client's main loop. """
+        """ This is the client's main loop.
+            
+            The scheduler calls this method every second, but only if
+            ``on_loop`` has been overridden.
+        """
         self.on_loop(*args, **kwargs)
-        self.defer.loop = reactor.callLater(1, self.mainloop, args, kwargs)
     
     def on_loop(self, *args, **kwargs):
-        """ Overwrite this if you need to do anything on the main application loop. """
+        """ Overwrite this if you need to do anything on the main application loop.
+            
+            Consider using ``scheduler`` instead, which can run tasks
+            at whatever time or interval they need.
+        """
         pass
     
     def timedout(self):
@@ -451,9 +534,20 @@ class ChatClient(IChatClient):
         self.pong()
     
     def send(self, data):
-        """ Send data to dAmn! """
+        """ Send data to dAmn!
+            
+            This method can be called from any thread. If it is not called
+            from the reactor's thread, the data is passed to the reactor
+            thread to be sent, and the number of characters that will be
+            sent is returned.
+        """
         if self.io is None:
             return 0
+        
+        if not threadable.isInIOThread():
+            reactor.callFromThread(self.send, data)
+            return len(data) + 1
+        
         return self.io.send_packet(data)
     
     def close(self):
@@ -471,8 +565,20 @@ class ChatClient(IChatClient):
     def format_ns(self, ns):
         """ This takes a dAmn channel name and formats it as a raw
             dAmn namespace.
+            
+            Results are cached in ``nscache``.
         """
         ns = str(ns)
+        cache = self.nscache
+        cache.check(self.user.username)
+        
+        try:
+            return cache.formatted[ns]
+        except KeyError:
+            return cache.store(cache.formatted, ns, self._format_ns(ns))
+    
+    def _format_ns(self, ns):
+        """ Uncached version of ``format_ns``. """
         un = self.user.username
         pre = ns[:1]
         if pre == '#':
@@ -489,7 +595,18 @@ class ChatClient(IChatClient):
     
     def deform_ns(self, ns):
         """ This does the opposite of format_ns() """
-        parts = str(ns).split(':')
+        ns = str(ns)
+        cache = self.nscache
+        cache.check(self.user.username)
+        
+        try:
+            return cache.deformed[ns]
+        except KeyError:
+            return cache.store(cache.deformed, ns, self._deform_ns(ns))
+    
+    def _deform_ns(self, ns):
+        """ Uncached version of ``deform_ns``. """
+        parts = ns.split(':')
         discard = self.user.username
         if parts[0].lower() == 'chat':
             return '#{0}'.format(parts[1])
@@ -515,8 +632,16 @@ class ChatClient(IChatClient):
         self.defer.timeout = reactor.callLater(self.timeout_delay, self.timedout)
     
     def handle_pkt(self, packet, stamp):
-        """ Handle packets as they come in. """
+        """ Handle packets as they come in.
+            
+            If ``timer`` is set, the time taken by the protocol mapper, the
+            protocol logger, and the ``pkt_*`` handler is recorded using
+            ``timer.record(stage, event_name, seconds)``. The ``timer`` object
+            must also provide a ``clock`` method, which returns the current
+            time in seconds.
+        """
         ns = self.default_ns
+        timer = self.timer
         
         if packet.param:
             if packet.param[:5] in ('chat:', 'pchat'):
@@ -524,15 +649,71 @@ class ChatClient(IChatClient):
             elif packet.param[:6] == 'login:':
                 ns = '@' + packet.param[6:]
         
+        if timer is not None:
+            start = timer.clock()
+        
         evt = self.protocol.mapper(packet)
+        
+        if timer is not None:
+            timer.record('mapper', evt.name, timer.clock() - start)
+        
+        if evt.name in ('recv_msg', 'recv_action'):
+            self.record(evt, stamp)
+        
+        if timer is not None:
+            start = timer.clock()
+        
         loglist = self.protocol.logger(evt, ns, packet)
         
+        if timer is not None:
+            timer.record('logger', evt.name, timer.clock() - start)
+        
         if loglist is not None:
             self.logger(*loglist, ts=stamp)
         
-        getattr(self, 'pkt_' + evt.name, self.pkt_unknown)(evt)
+        if timer is None:
+            self.handlers.get(evt.name, self.pkt_unknown)(evt)
+        else:
+            start = timer.clock()
+            self.handlers.get(evt.name, self.pkt_unknown)(evt)
+            timer.record('handler', evt.name, timer.clock() - start)
+        
         self.pkt_generic(evt)
     
+    def record(self, event, stamp):
+        """ Store a message in the history of the channel it was sent to.
+            
+            Messages are only stored if the client is keeping message
+            histories, which is the case when ``history_size`` is greater
+            than ``0``.
+        """
+        try:
+            history = self.channel[event.arguments['ns']].history
+        except KeyError:
+            return
+        
+        if history is None:
+            return
+        
+        history.append(stamp, event.name, event.arguments['user'], event.arguments['message'])
+    
+    def balance_history(self):
+        """ Share the history limit between the channels the client is in.
+            
+            Each channel can store up to ``history_size`` messages, but the
+            total number of messages stored across all channels will not
+            exceed ``history_limit``.
+        """
+        chans = [chan for chan in self.channel.values() if chan.history is not None]
+        
+        if not chans:
+            return
+        
+        size = min(self.history_size, self.history_limit // len(chans))
+        
+        for chan in chans:
+            chan.history.resize(size)
+    
     # PROTOCOL OUTPUT
     # The methods below pretty much define the protocol for outgoing packets.
 
@@ -702,7 +883,8 @@ class ChatClient(IChatClient):
         """
         if event.arguments['e'] == 'ok':
             ns = event.arguments['ns']
-            self.channel[ns] = Channel(ns, self.deform_ns(ns))
+            self.channel[ns] = Channel(ns, self.deform_ns(ns), self.history_size)
+            self.balance_history()
             return
         
         if len(self.channel) > 0:
@@ -718,6 +900,7 @@ class ChatClient(IChatClient):
         """
         if event.arguments['ns'] in self.channel.keys():
             del self.channel[event.arguments['ns']]
+            self.balance_history()
         
         if len(self.channel) > 0:
             return
@@ -749,7 +932,23 @@ class ChatClient(IChatClient):
         if not event.arguments['ns'] in self.channel.keys():
             return
         
-        self.channel[event.arguments['ns']].process_property(event)
+        ns = event.arguments['ns']
+        
+        for kind, user, info in self.channel[ns].process_property(event):
+            self.pkt_generic(self.member_delta(ns, kind, user, info))
+    
+    def member_delta(self, ns, kind, user, info):
+        """ Create a synthetic ``recv_join`` or ``recv_part`` event.
+            
+            These events are created when a ``members`` property shows
+            changes that the client was not told about. The channel's member
+            list has already been updated by the time these events are
+            created, so they are only given to ``pkt_generic``.
+        """
+        if kind == 'join':
+            return PacketEvent('recv_join', [('ns', ns), ('user', user), ('info', info)])
+        
+        return PacketEvent('recv_part', [('ns', ns), ('user', user), ('r', '')])
     
     def pkt_recv_join(self, event):
         """ Received a recv_join packet.
@@ -813,6 +1012,8 @@ class ChatClient(IChatClient):
             to do so.
         """
         del self.channel[event.arguments['ns']]
+        self.balance_history()
+        
         if self.flag.disconnecting or self.flag.quitting:
             return
         
@@ -7,21 +7,18 @@
     affiliated with or endorsed by deviantART.com. This is not an official
     service of deviantART.com. This is an independent project created by
     photofroggy.
+    
+    The ``twisted.web`` modules this needs are only imported when a request
+    is sent, or the oAuth client is started, so importing this module is
+    cheap.
 '''
 
 
 import json
 from urllib import urlencode
 
-from twisted.web import server
-from twisted.web import resource
 from twisted.internet import defer
 from twisted.internet import protocol
-from twisted.web.client import Agent
-from twisted.web.http_headers import Headers
-
-
-from dAmnViper.dA.oauth import oAuthClient
 
 
 class ResponseReceiver(protocol.Protocol):
@@ -80,6 +77,9 @@ class Request(object):
     
     def start_request(self):
         """ Send the api request to deviantART. """
+        from twisted.web.client import Agent
+        from twisted.web.http_headers import Headers
+        
         agent = Agent(self._reactor)
         d = agent.request('POST', self.url, Headers({'User-Agent': [self.agent]}), None)
         d.addCallback(self.received_response)
@@ -141,6 +141,8 @@ class APIClient(object):
             Provide custom HTML in the ``html`` parameter to provide a custom
             response page to be given in return to web requests.
         """
+        from dAmnViper.dA.oauth import oAuthClient
+        
         client = oAuthClient(self._reactor, port, resource, html)
         # Start serving requests.
         d = client.serve()
@@ -7,8 +7,173 @@
     such as the title/topic, and users in the channel.
 '''
 
+from collections import deque
+
 from dAmnViper.parse import Packet
 
+
+class Message(object):
+    """ A single message stored in a channel's history.
+        
+        * ``seq`` - The position of the message in the channel's history.
+          This counts up from ``0`` for the lifetime of the history object.
+        * ``ts`` - The time the message was received.
+        * ``event`` - The name of the event, ``recv_msg`` or
+          ``recv_action``.
+        * ``user`` - The user who sent the message.
+        * ``message`` - The content of the message.
+    """
+    
+    def __init__(self, seq, ts, event, user, message):
+        self.seq = seq
+        self.ts = ts
+        self.event = event
+        self.user = user
+        self.message = message
+    
+    def __str__(self):
+        if self.event == 'recv_action':
+            return '* {0} {1}'.format(self.user, self.message)
+        return '<{0}> {1}'.format(self.user, self.message)
+
+
+class History(object):
+    """ Bounded history of the messages received in a channel.
+        
+        Messages are stored in a list of fixed length which is used as a
+        ring buffer, so once the history is full each new message replaces
+        the oldest one. The position of a message in the buffer is given by
+        ``seq % size``.
+        
+        A separate index of sequence numbers is kept for each user, so
+        that the messages sent by one user can be found without looking
+        at every message in the buffer.
+        
+        Timestamps are expected to increase as messages are added, which
+        is always the case for messages taken straight off the connection.
+    """
+    
+    def __init__(self, size):
+        self.size = 0
+        self.count = 0
+        self.length = 0
+        self.buffer = []
+        self.users = {}
+        self.resize(size)
+    
+    def __len__(self):
+        return self.length
+    
+    def __iter__(self):
+        return iter(self.between(self.oldest(), self.count))
+    
+    def oldest(self):
+        """ Return the sequence number of the oldest stored message. """
+        return self.count - len(self)
+    
+    def append(self, ts, event, user, message):
+        """ Add a message to the history.
+            
+            If the history is full, the oldest message is dropped. Returns
+            the new :py:class:`Message <dAmnViper.data.Message>` object, or
+            ``None`` if the history has no space at all.
+        """
+        if self.size == 0:
+            return None
+        
+        slot = self.count % self.size
+        
+        if self.length == self.size:
+            self.forget(self.buffer[slot])
+        else:
+            self.length+= 1
+        
+        msg = Message(self.count, ts, event, user, message)
+        self.buffer[slot] = msg
+        self.count+= 1
+        
+        key = user.lower()
+        
+        try:
+            self.users[key].append(msg.seq)
+        except KeyError:
+            self.users[key] = deque([msg.seq])
+        
+        return msg
+    
+    def forget(self, msg):
+        """ Remove a message that is about to be dropped from the user index. """
+        key = msg.user.lower()
+        seqs = self.users[key]
+        seqs.popleft()
+        
+        if not seqs:
+            del self.users[key]
+    
+    def resize(self, size):
+        """ Change the number of messages the history can hold.
+            
+            The most recent messages are kept when the history shrinks.
+        """
+        size = max(int(size), 0)
+        
+        if size == self.size:
+            return
+        
+        keep = self.between(max(self.oldest(), self.count - size), self.count)
+        
+        for msg in self.between(self.oldest(), self.count - len(keep)):
+            self.forget(msg)
+        
+        self.size = size
+        self.length = len(keep)
+        self.buffer = [None] * size
+        
+        for msg in keep:
+            self.buffer[msg.seq % size] = msg
+    
+    def between(self, start, end):
+        """ Return stored messages with sequence numbers in ``[start, end)``. """
+        return [self.buffer[seq % self.size] for seq in xrange(start, end)]
+    
+    def last(self, n=None):
+        """ Return the last ``n`` messages, oldest first.
+            
+            If ``n`` is ``None``, every stored message is returned.
+        """
+        if n is None or n > len(self):
+            n = len(self)
+        
+        return self.between(self.count - n, self.count)
+    
+    def since(self, ts):
+        """ Return all stored messages received at or after ``ts``. """
+        low, high = self.oldest(), self.count
+        
+        while low < high:
+            mid = (low + high) // 2
+            
+            if self.buffer[mid % self.size].ts < ts:
+                low = mid + 1
+            else:
+                high = mid
+        
+        return self.between(low, self.count)
+    
+    def by_user(self, user, n=None):
+        """ Return the last ``n`` stored messages sent by ``user``. """
+        try:
+            seqs = self.users[user.lower()]
+        except KeyError:
+            return []
+        
+        if n is None or n > len(seqs):
+            n = len(seqs)
+        
+        seqs = list(seqs)[len(seqs) - n:]
+        return [self.buffer[seq % self.size] for seq in seqs]
+
+
 class Channel(object):
     """ Objects representing dAmn channels.
     
@@ -41,6 +206,9 @@ class Channel(object):
         * ``type`` - A string in for format ``<dAmn channel
           'namespace'>`` where ``namespace`` is the same as the object's
           ``namespace`` attribute.
+        * ``history`` - An instance of :py:class:`History
+          <dAmnViper.data.History>` storing recent messages, or ``None`` if
+          message history is not being kept.
         
         Calling ``str(channel)``, where ``channel`` is an instance of
         the ``Channel`` class, returns the ``namespace`` attribute.
@@ -66,13 +234,14 @@ class Channel(object):
             self.by = ''
             self.ts = 0.0
     
-    def __init__(self, namespace, shorthand):
+    def __init__(self, namespace, shorthand, history=0):
         """Set up all our variables."""
         self.title = Channel.Header()
         self.topic = Channel.Header()
         self.pc = {}
         self.pc_order = []
         self.member = {}
+        self.history = History(history) if history else None
         
         self.namespace = namespace
         self.shorthand = shorthand
@@ -84,6 +253,10 @@ class Channel(object):
             
             This method makes sure that the data is stored in the right
             places in the object.
+            
+            A list of membership changes is returned. This is only ever
+            populated when a ``members`` property is received for a channel
+            whose member list is already known. See ``reconcile``.
         """
         if data.arguments['p'] == 'title':
             self.title.content = data.arguments['value']
@@ -101,10 +274,76 @@ class Channel(object):
             self.pc_order.reverse()
         
         if data.arguments['p'] == 'members':
-            member = Packet(data.arguments['value'])
-            while member.cmd != None and len(member.args) > 0:
-                self.register_user(member)
-                member = Packet(member.body)
+            if not self.member:
+                member = Packet(data.arguments['value'])
+                while member.cmd != None and len(member.args) > 0:
+                    self.register_user(member)
+                    member = Packet(member.body)
+                return []
+            
+            return self.reconcile(data.arguments['value'])
+        
+        return []
+    
+    def reconcile(self, value):
+        """ Bring the member list up to date with a fresh ``members`` property.
+            
+            Rather than rebuilding the ``member`` dictionary, the new member
+            list is compared with the current one and only the differences
+            are applied. This method returns a list of ``(kind, user, info)``
+            tuples describing those differences, where ``kind`` is either
+            ``'join'`` or ``'part'``. One tuple is given for each connection
+            a user has gained or lost, so the list can be treated like the
+            ``recv_join`` and ``recv_part`` packets that were missed.
+            
+            ``info`` is the user's information as a ``key=value`` string, in
+            the same form as the ``info`` argument of ``recv_join`` events.
+        """
+        fresh = {}
+        member = Packet(value)
+        
+        while member.cmd != None and len(member.args) > 0:
+            user = member.param
+            
+            if user in fresh:
+                fresh[user]['con']+= 1
+            else:
+                fresh[user] = dict(member.args)
+                fresh[user]['con'] = 1
+            
+            member = Packet(member.body)
+        
+        deltas = []
+        
+        for user, info in self.member.items():
+            if user in fresh:
+                continue
+            
+            deltas.extend([('part', user, self.user_info(info))] * info['con'])
+            del self.member[user]
+        
+        for user, info in fresh.items():
+            current = self.member.get(user, None)
+            
+            if current is None:
+                self.member[user] = info
+                deltas.extend([('join', user, self.user_info(info))] * info['con'])
+                continue
+            
+            change = info['con'] - current['con']
+            current.update(info)
+            
+            if change:
+                kind = 'join' if change > 0 else 'part'
+                deltas.extend([(kind, user, self.user_info(info))] * abs(change))
+        
+        return deltas
+    
+    def user_info(self, info):
+        """ Return a user's stored information as a ``key=value`` string. """
+        return '\n'.join([
+            '{0}={1}'.format(key, value) for key, value in info.items() if key != 'con'
+        ])
     
     def register_user(self, info, user = None):
         """ Called when a user joins the channel.
@@ -142,18 +142,33 @@ class ChatProtocol(Protocol):
             
             Any event handling relating to specific packets is done in the
             ``ChatClient`` instance.
+            
+            If the client has a ``timer``, the time taken to split the data
+            into packets and to parse each packet is recorded.
         """
         
         # Tell the client some data has arrived. Woo...
         self.client.dataReceived(data)
+        timer = self.client.timer
+        
+        if timer is not None:
+            start = timer.clock()
         
         # Split on null.
         self.__buffer+= data
         raw = self.__buffer.split('\0')
         self.__buffer = raw.pop()
         
+        if timer is not None:
+            timer.record('framing', None, timer.clock() - start)
+        
         for chunk in raw:
-            packet = Packet(chunk)
+            if timer is None:
+                packet = Packet(chunk)
+            else:
+                start = timer.clock()
+                packet = Packet(chunk)
+                timer.record('parse', packet.cmd, timer.clock() - start)
             
             # If it's a ping packet, send a pong straight away!
             if packet.cmd == 'ping':
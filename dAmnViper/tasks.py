@@ -0,0 +1,367 @@
+''' dAmnViper.tasks module
+    Copyright (c) 2011, Henry "photofroggy" Rapley.
+    Released under the ISC License.
+    
+    This module provides the Scheduler, which lets clients and applications
+    run methods after a delay, at regular intervals, or on a cron-like
+    schedule. All scheduled tasks share a single delayed call on the reactor,
+    which is only ever set for the next task that is due.
+'''
+
+# Standard library
+import time
+import heapq
+import datetime
+import traceback
+from itertools import count
+
+# Twisted library imports
+from twisted.internet import reactor
+
+
+class Cron(object):
+    """ Cron-like schedule.
+        
+        A schedule is given as a string of five fields, separated by
+        spaces. The fields are the minute, hour, day of the month, month and
+        day of the week, in that order. Days of the week are numbered from
+        ``0`` (Sunday) to ``6`` (Saturday).
+        
+        Each field can be ``*``, a number, a range like ``1-5``, or a comma
+        separated list of these. Any of these can be given a step, so
+        ``*/15`` in the minute field means every 15 minutes.
+        
+        As an example, ``'30 9 * * 1-5'`` means 9:30 every weekday.
+        
+        Raises a ``ValueError`` if the schedule can not be parsed.
+    """
+    
+    fields = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 6))
+    
+    def __init__(self, spec):
+        self.spec = spec
+        parts = spec.split()
+        
+        if len(parts) != 5:
+            raise ValueError('Cron schedules need 5 fields: {0}'.format(spec))
+        
+        values = [self.parse(part, low, high) for part, (low, high) in zip(parts, self.fields)]
+        self.minutes, self.hours, self.days, self.months, self.weekdays = values
+        self.anyday = parts[2] == '*'
+        self.anyweekday = parts[4] == '*'
+    
+    def parse(self, field, low, high):
+        """ Return the set of values matched by one field. """
+        values = set()
+        
+        for item in field.split(','):
+            item, sep, step = item.partition('/')
+            step = int(step) if sep else 1
+            
+            if item == '*':
+                start, end = low, high
+            elif '-' in item:
+                start, end = [int(i) for i in item.split('-', 1)]
+            else:
+                start = end = int(item)
+            
+            if start < low or end > high or start > end or step < 1:
+                raise ValueError('Invalid cron field: {0}'.format(field))
+            
+            values.update(range(start, end + 1, step))
+        
+        return values
+    
+    def matches_day(self, stamp):
+        """ Determine whether the schedule runs on the given date. """
+        day = stamp.day in self.days
+        weekday = (stamp.weekday() + 1) % 7 in self.weekdays
+        
+        if self.anyday:
+            return weekday
+        
+        if self.anyweekday:
+            return day
+        
+        return day or weekday
+    
+    def next(self, now):
+        """ Return the next time after ``now`` that the schedule runs. """
+        stamp = datetime.datetime.fromtimestamp(now).replace(second=0, microsecond=0)
+        stamp+= datetime.timedelta(minutes=1)
+        limit = stamp.year + 5
+        
+        while stamp.year <= limit:
+            if not stamp.month in self.months:
+                stamp = datetime.datetime(stamp.year + stamp.month // 12, stamp.month % 12 + 1, 1)
+                continue
+            
+            if not self.matches_day(stamp):
+                stamp = datetime.datetime(stamp.year, stamp.month, stamp.day) + datetime.timedelta(days=1)
+                continue
+            
+            if not stamp.hour in self.hours:
+                stamp = stamp.replace(minute=0) + datetime.timedelta(hours=1)
+                continue
+            
+            if not stamp.minute in self.minutes:
+                stamp+= datetime.timedelta(minutes=1)
+                continue
+            
+            return time.mktime(stamp.timetuple())
+        
+        raise ValueError('Cron schedule never runs: {0}'.format(self.spec))
+
+
+class Task(object):
+    """ A scheduled call.
+        
+        Instances of this class are returned by the scheduling methods of
+        the :py:class:`Scheduler <dAmnViper.tasks.Scheduler>`. The most
+        useful attributes and methods are:
+        
+        * ``when`` - The time the task is next due to run.
+        * ``calls`` - The number of times the task has run.
+        * ``owner`` - Whatever created the task. This can be used to cancel
+          all of the tasks created by one object.
+        * ``cancel()`` - Stop the task from running again.
+        * ``active()`` - Returns ``True`` if the task will run again.
+    """
+    
+    def __init__(self, scheduler, when, call, args, kwargs, interval=None, cron=None):
+        self.scheduler = scheduler
+        self.when = when
+        self.call = call
+        self.args = args
+        self.kwargs = kwargs
+        self.interval = interval
+        self.cron = cron
+        self.owner = None
+        self.calls = 0
+        self.queued = False
+        self.cancelled = False
+    
+    def active(self):
+        """ Determine whether or not the task will run again. """
+        return not self.cancelled
+    
+    def cancel(self):
+        """ Stop the task from running again. """
+        if self.cancelled:
+            return
+        
+        self.cancelled = True
+        self.scheduler.discard(self)
+    
+    def next(self, now):
+        """ Return the next time the task should run, or ``None``. """
+        if self.cron is not None:
+            return self.cron.next(now)
+        
+        if self.interval is None:
+            return None
+        
+        # Keep to the original schedule, unless we have fallen behind.
+        when = self.when + self.interval
+        return when if when > now else now + self.interval
+
+
+class Scheduler(object):
+    """ Task scheduler.
+        
+        Tasks are kept in a heap ordered by the time they are next due. Only
+        one delayed call is ever set on the reactor, for the earliest task
+        in the heap. When it fires, every task that is due is run in one
+        batch and the delayed call is set again for the next task. This
+        means the cost of each tick only depends on the number of tasks
+        that are due, not on the number of tasks that have been scheduled.
+        
+        Tasks that are due within ``resolution`` seconds of each other are
+        run in the same batch.
+        
+        The scheduler does not run anything until ``start`` is called.
+        
+        Input parameters:
+        
+        * **clock** - The object used to set delayed calls and get the
+          current time. This defaults to the twisted reactor, but can be any
+          object with ``callLater`` and ``seconds`` methods.
+        * *callable* **stdout** - Method used to log errors raised by tasks.
+    """
+    
+    resolution = 0.01
+    
+    def __init__(self, clock=None, stdout=None):
+        self.clock = clock or reactor
+        self.log = stdout or (lambda m: None)
+        self.heap = []
+        self.due = []
+        self.order = count()
+        self.pending = None
+        self.running = False
+        self.dead = 0
+    
+    def __len__(self):
+        return len(self.heap) - self.dead
+    
+    def start(self):
+        """ Start running scheduled tasks. """
+        self.running = True
+        self.arm()
+    
+    def stop(self):
+        """ Stop running tasks. Tasks stay scheduled until cancelled. """
+        self.running = False
+        
+        if self.pending is not None and self.pending.active():
+            self.pending.cancel()
+        
+        self.pending = None
+    
+    def call_later(self, delay, call, *args, **kwargs):
+        """ Run ``call`` once, after ``delay`` seconds. """
+        return self.schedule(Task(self, self.clock.seconds() + delay, call, args, kwargs))
+    
+    def call_every(self, interval, call, *args, **kwargs):
+        """ Run ``call`` every ``interval`` seconds.
+            
+            The first call happens ``interval`` seconds from now.
+        """
+        if interval <= 0:
+            raise ValueError('interval must be greater than 0')
+        
+        return self.schedule(Task(self, self.clock.seconds() + interval, call, args, kwargs, interval))
+    
+    def call_cron(self, spec, call, *args, **kwargs):
+        """ Run ``call`` according to a cron-like schedule.
+            
+            See :py:class:`Cron <dAmnViper.tasks.Cron>` for the format of
+            ``spec``.
+        """
+        cron = Cron(spec)
+        return self.schedule(Task(self, cron.next(self.clock.seconds()), call, args, kwargs, cron=cron))
+    
+    def schedule(self, task):
+        """ Add a task to the heap. """
+        self.push(task)
+        
+        if self.heap[0][2] is task:
+            self.arm()
+        
+        return task
+    
+    def push(self, task):
+        """ Push a task onto the heap. """
+        task.queued = True
+        heapq.heappush(self.heap, (task.when, next(self.order), task))
+    
+    def pop(self):
+        """ Pop the earliest task off the heap. """
+        task = heapq.heappop(self.heap)[2]
+        task.queued = False
+        
+        if task.cancelled:
+            self.dead-= 1
+        
+        return task
+    
+    def discard(self, task):
+        """ Called when a task is cancelled.
+            
+            Cancelled tasks are left in the heap and skipped when they come
+            up. If they make up most of the heap, the heap is rebuilt.
+        """
+        if not task.queued:
+            return
+        
+        self.dead+= 1
+        
+        if self.dead < 64 or self.dead * 2 < len(self.heap):
+            return
+        
+        for item in self.heap:
+            item[2].queued = not item[2].cancelled
+        
+        self.heap = [item for item in self.heap if not item[2].cancelled]
+        heapq.heapify(self.heap)
+        self.dead = 0
+    
+    def cancel_owner(self, owner):
+        """ Cancel every task belonging to ``owner``.
+            
+            This includes tasks which are being run, which are not in the
+            heap until they have been run and scheduled again.
+        """
+        for task in [item[2] for item in self.heap] + self.due:
+            if task.owner is owner:
+                task.cancel()
+    
+    def arm(self):
+        """ Set a delayed call for the next task that is due. """
+        if not self.running:
+            return
+        
+        while self.heap and self.heap[0][2].cancelled:
+            self.pop()
+        
+        if not self.heap:
+            return
+        
+        when = self.heap[0][0]
+        
+        if self.pending is not None and self.pending.active():
+            if self.pending.getTime() <= when:
+                return
+            self.pending.cancel()
+        
+        self.pending = self.clock.callLater(max(when - self.clock.seconds(), 0), self.tick)
+    
+    def tick(self):
+        """ Run all of the tasks that are due. """
+        self.pending = None
+        now = self.clock.seconds()
+        limit = now + self.resolution
+        due = self.due = []
+        
+        while self.heap and self.heap[0][0] <= limit:
+            task = self.pop()
+            
+            if not task.cancelled:
+                due.append(task)
+        
+        for task in due:
+            # Tasks can be cancelled by the tasks run before them.
+            if task.cancelled:
+                continue
+            
+            self.run(task)
+            
+            if task.cancelled:
+                continue
+            
+            when = task.next(now)
+            
+            if when is None:
+                task.cancelled = True
+                continue
+            
+            task.when = when
+            self.push(task)
+        
+        self.due = []
+        self.arm()
+    
+    def run(self, task):
+        """ Run a single task. """
+        task.calls+= 1
+        
+        try:
+            task.call(*task.args, **task.kwargs)
+        except Exception as e:
+            self.log('>> Scheduled task {0} failed!'.format(getattr(task.call, '__name__', task.call)))
+            self.log('>> Error:')
+            for line in traceback.format_exc().splitlines():
+                self.log('>> {0}'.format(line))
+
+
+# EOF
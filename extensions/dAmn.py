@@ -6,6 +6,13 @@
 from slate.extension import ExtensionBase
 
 
+manifest = [
+    ('command', {'cmd': 'join', 'priv': 'Operators'}),
+    ('command', {'cmd': 'part', 'priv': 'Operators'}),
+    ('command', {'cmd': 'refresh', 'priv': 'Owner'}),
+]
+
+
 class Extension(ExtensionBase):
     
     def init(self, core):
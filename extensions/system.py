@@ -13,6 +13,12 @@ class Extension(ExtensionBase):
         self.bind(self.agent, 'command', cmd='agent', priv='Guests')
         self.bind(self.commands, 'command', cmd='commands', priv='Guests')
         self.bind(self.quit, 'command', cmd='quit', priv='Owner')
+        self.bind(self.timings, 'command', cmd='timings', priv='Owner')
+        self.bind(self.workers, 'command', cmd='workers', priv='Owner')
+        self.bind(self.stalls, 'command', cmd='stalls', priv='Owner')
+        self.bind(self.queue, 'command', cmd='queue', priv='Owner')
+        self.bind(self.reload, 'command', cmd='reload', priv='Owner')
+        self.bind(self.profile, 'command', cmd='profile', priv='Owner')
         
     def about(self, cmd, dAmn):
         dAmn.say(cmd.ns, '{0}: Running Slate {1}.{2} {3} by p<b></b>hotofroggy. My owner is {4}.'.format(
@@ -27,14 +33,11 @@ class Extension(ExtensionBase):
         dAmn.say(cmd.ns, '{0}: <code>{1}</code>'.format(cmd.user, self.core.agent))
     
     def commands(self, cmd, dAmn):
-        cmds = self.core.events.rules['command'].index.keys()
-        cmds.sort()
-        index = self.core.events.rules['command'].index
+        commands = self.core.events.map.get('command', {})
         available = []
         
-        for name in cmds:
-            obj = self.core.events.map['command'][index[name]]
-            if self.core.users.has(cmd.user, obj.group):
+        for name, binding in sorted(commands.items()):
+            if self.core.users.has(cmd.user, binding.group):
                 available.append(name)
         
         dAmn.say(cmd.ns, '{0}: Available commands: <code>{1}</code>'.format(cmd.user, ', '.join(available)))
@@ -43,6 +46,115 @@ class Extension(ExtensionBase):
         dAmn.say(cmd.ns, '{0}: Shutting down...'.format(cmd.user))
         dAmn.flag.quitting = True
         dAmn.disconnect()
+    
+    def timings(self, cmd, dAmn):
+        option = cmd.arguments(0).lower()
+        
+        if option == 'on':
+            period = cmd.arguments(1)
+            self.core.enable_timings(int(period) if period.isdigit() else None)
+            dAmn.say(cmd.ns, '{0}: Recording pipeline timings.'.format(cmd.user))
+            return
+        
+        if option == 'off':
+            self.core.disable_timings()
+            dAmn.say(cmd.ns, '{0}: No longer recording pipeline timings.'.format(cmd.user))
+            return
+        
+        if self.core.timings is None:
+            dAmn.say(cmd.ns, '{0}: No timings have been recorded. Use <code>timings on [period]</code>.'.format(cmd.user))
+            return
+        
+        if option == 'dump':
+            self.core.dump_timings()
+            dAmn.say(cmd.ns, '{0}: Timings written to <code>storage/timings.txt</code>.'.format(cmd.user))
+            return
+        
+        if option == 'reset':
+            self.core.timings.reset()
+            dAmn.say(cmd.ns, '{0}: Timings reset.'.format(cmd.user))
+            return
+        
+        stages = sorted(self.core.timings.stages().items())
+        dAmn.say(cmd.ns, '{0}: <bcode>{1}</bcode>'.format(cmd.user, '\n'.join([
+            '{0}: {1}'.format(stage, histogram.summary()) for stage, histogram in stages
+        ]) or 'Nothing recorded yet.'))
+    
+    def profile(self, cmd, dAmn):
+        option = cmd.arguments(0).lower()
+        
+        if option == 'on':
+            period = cmd.arguments(1)
+            self.core.enable_profile(int(period) if period.isdigit() else None)
+            dAmn.say(cmd.ns, '{0}: Profiling event handlers.'.format(cmd.user))
+            return
+        
+        if option == 'off':
+            self.core.disable_profile()
+            dAmn.say(cmd.ns, '{0}: No longer profiling event handlers.'.format(cmd.user))
+            return
+        
+        if self.core.profile is None:
+            dAmn.say(cmd.ns, '{0}: No profile has been recorded. Use <code>profile on [period]</code>.'.format(cmd.user))
+            return
+        
+        if option == 'dump':
+            self.core.dump_profile()
+            dAmn.say(cmd.ns, '{0}: Profile written to <code>storage/profile.txt</code>.'.format(cmd.user))
+            return
+        
+        if option == 'reset':
+            self.core.profile.reset()
+            dAmn.say(cmd.ns, '{0}: Profile reset.'.format(cmd.user))
+            return
+        
+        report = self.core.profile.report(self.core.events.rules.keys(), 10)
+        dAmn.say(cmd.ns, '{0}: <bcode>{1}</bcode>'.format(cmd.user, '\n'.join(report)))
+    
+    def workers(self, cmd, dAmn):
+        report = []
+        
+        for name, pool in (('Threads', self.core.threads), ('Processes', self.core.processes)):
+            report.append(('{0}: {1[busy]}/{1[size]} busy, {1[queued]}/{1[limit]} queued '
+                + '(peak {1[peak]}). {1[submitted]} submitted, {1[completed]} completed, '
+                + '{1[failed]} failed, {1[rejected]} rejected, {1[saturated]} waited '
+                + 'for a worker.').format(name, pool.stats()))
+        
+        dAmn.say(cmd.ns, '{0}: <bcode>{1}</bcode>'.format(cmd.user, '\n'.join(report)))
+    
+    def stalls(self, cmd, dAmn):
+        dAmn.say(cmd.ns, '{0}: <bcode>{1}</bcode>'.format(cmd.user, '\n'.join(self.core.watchdog.report())))
+    
+    def queue(self, cmd, dAmn):
+        inbound = self.core.client.inbound
+        
+        if cmd.arguments(0).lower() == 'weight':
+            ns = cmd.arguments(1)
+            
+            try:
+                weight = float(cmd.arguments(2))
+                inbound.weigh(ns, weight)
+            except ValueError:
+                dAmn.say(cmd.ns, '{0}: Usage: <code>queue weight #channel weight</code>, with a weight greater than 0.'.format(cmd.user))
+                return
+            
+            self.core.config.inbound['weights'][inbound.key(ns)] = weight
+            self.core.config.save()
+            dAmn.say(cmd.ns, '{0}: Weight for {1} set to {2}.'.format(cmd.user, ns, weight))
+            return
+        
+        dAmn.say(cmd.ns, '{0}: <bcode>{1}</bcode>'.format(cmd.user, '\n'.join(inbound.report())))
+    
+    def reload(self, cmd, dAmn):
+        timings = self.core.reload_extensions()
+        
+        if not timings:
+            dAmn.say(cmd.ns, '{0}: No extensions have changed.'.format(cmd.user))
+            return
+        
+        dAmn.say(cmd.ns, '{0}: Reloaded {1}.'.format(cmd.user, ', '.join([
+            '{0} ({1:.1f}ms)'.format(name.split('.')[-1], seconds * 1000) for name, seconds in sorted(timings.items())
+        ])))
 
 
 # EOF
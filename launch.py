@@ -13,6 +13,11 @@ def main_program(select=None):
     file.write(str(os.getpid()))
     file.close()
     
+    if '--profile-startup' in os.sys.argv:
+        os.sys.argv.remove('--profile-startup')
+        import slate.startup
+        slate.startup.enable()
+    
     if select is None:
         select = '--bot' if len(os.sys.argv) < 2 else os.sys.argv[1]
     
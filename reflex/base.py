@@ -8,11 +8,13 @@
 '''
 
 # Standard Lib imports.
+import threading
 import traceback
 from functools import wraps
 from collections import Callable
 # Custom
 from reflex.data import Binding
+from reflex.data import Bindings
 
 class Reactor(object):
     """ Reactor base class.
@@ -57,6 +59,7 @@ class Reactor(object):
         self._bind = manager.bind
         self._unbind = manager.unbind
         self.trigger = manager.trigger
+        self.bindings = []
         
         if self.name is None:
             self.name = str(self.__class__).split('.')[-2].replace('_', ' ')
@@ -73,12 +76,51 @@ class Reactor(object):
         
     def bind(self, method, event, **options):
         """ This is a wrapper for :py:meth:`reflex.control.EventManager.bind`.
+            
+            Bindings made through the reactor are kept in ``bindings``, and
+            have their ``source`` set to the name of the reactor.
         """
-        return self._bind(method, event, **options)
+        binding = self._bind(method, event, **options)
+        
+        if binding is not None:
+            binding.source = self.name
+            self.bindings.append(binding)
+        
+        return binding
     
     def unbind(self, method, event, **options):
         """ Another wrapper like ``bind``. """
+        self.bindings = [binding for binding in self.bindings if not (binding.call == method
+            and binding.event == event and binding.options == binding.clean(options))]
         return self._unbind(method, event, **options)
+    
+    def release(self):
+        """ Remove every binding made through the reactor.
+            
+            This is used when the reactor is being replaced, like when its
+            module is reloaded. Returns the bindings which were removed.
+        """
+        bindings, self.bindings = self.bindings, []
+        
+        for binding in bindings:
+            self._unbind(binding.call, binding.event, **binding.settings())
+        
+        return bindings
+    
+    def restore(self, bindings):
+        """ Bind a list of bindings removed by ``release()`` again. """
+        for binding in bindings:
+            self.bind(binding.call, binding.event, **binding.settings())
+    
+    def discard(self):
+        """ Called when the reactor has been replaced or removed for good.
+            
+            ``release()`` is called first, but the reactor may still be put
+            back with ``restore()`` if its replacement fails to load. Use
+            this method to clean up anything which can not be put back.
+            This is a do-nothing method.
+        """
+        pass
         
     def handler(self, event, **options):
         """ Can be used as a decorator to bind events. """
@@ -113,12 +155,26 @@ class Ruleset(object):
         
         An instance of this class is used for all events that do not have
         a specific ruleset assigned to them.
+        
+        Bindings are indexed by the value of one of their options, so that
+        ``select()`` only returns the bindings which could match an event,
+        rather than every binding for the event.
+        
+        Binding and unbinding are done while holding ``lock``, so they can
+        be used from any thread. Events can be triggered while bindings are
+        changed, as triggers only use snapshots of the bindings.
     """
+    
+    timer = None
+    profiler = None
+    executors = {}
 
     def __init__(self, args, kwargs, mapref, stdout, stddebug):
         self.mapref = mapref
         self._write = stdout
         self.debug = stddebug
+        self.lookup = {}
+        self.lock = threading.RLock()
         
         self.init(*args, **kwargs)
     
@@ -147,6 +203,7 @@ class Ruleset(object):
             ``clear_bindings()`` method.
         """
         self.mapref = mapref
+        self.lookup = {}
 
     def bind(self, meth, event, **options):
         """ Create an event binding.
@@ -159,18 +216,16 @@ class Ruleset(object):
             If there is a clash, then the method returns ``None``,
             otherwise an instance of the :ref:`Binding <data-binding>`
             class is returned. The instance is also added to the object
-            referenced by ``self.mapref``.
+            referenced by ``self.mapref``, in the ``reflex.data.Bindings``
+            registry for the event.
         """
-        
-        if event in self.mapref.keys():
-            for binding in self.mapref[event]:
-                if (binding.call, binding.options) == (meth, options):
-                    return None
-        else:
-            self.mapref[event] = []
-        
         new_binding = Binding(meth, event, options)
-        self.mapref[event].append(new_binding)
+        
+        with self.lock:
+            bindings = self.mapref.setdefault(event, Bindings())
+            
+            if not bindings.add(new_binding):
+                return None
         
         return new_binding
     
@@ -182,22 +237,100 @@ class Ruleset(object):
             if a matching event binding was found and removed, ``False``
             if no bindings were removed.
         """
-        rmd = False
-        options = options if options else []
-        
-        if event in self.mapref.keys():
-            for binding in self.mapref[event]:
-                if (binding.call, binding.options) == (meth, options):
-                    del self.mapref[event][self.mapref[event].index(binding)]
-                    rmd = True
-                    break
-        
-        if event in self.mapref.keys():
-            if not self.mapref[event]:
+        with self.lock:
+            bindings = self.mapref.get(event)
+            
+            if bindings is None:
+                return False
+            
+            rmd = bindings.remove(meth, Binding.clean(options)) is not None
+            
+            if not bindings:
                 del self.mapref[event]
+            
+            # The index holds the old snapshot, and with it the binding.
+            if rmd:
+                self.lookup.pop(event, None)
         
         return rmd
     
+    def index(self, bindings):
+        """ Build the index for a snapshot of the bindings for an event.
+            
+            Each binding is filed under its first option, by name, and the
+            value of that option as a lower case string. Bindings without
+            options, or with an option that can not be turned into a
+            string, are kept in a separate list as they always need to be
+            checked. Bindings are stored with their position in the event
+            map, so that ``select()`` can return them in the order they
+            should run.
+            
+            Returns a tuple of the snapshot, the unindexed bindings, and a
+            dict mapping option names to dicts of values and bindings.
+            
+            Indexes are built when they are first needed, and kept in
+            ``lookup``. An index is built again when the snapshot it was
+            built from is replaced.
+        """
+        unkeyed = []
+        keyed = {}
+        
+        for position, binding in enumerate(bindings):
+            if not binding.conditions or binding.conditions[0][2] is None:
+                unkeyed.append((position, binding))
+                continue
+            
+            key, option, value, kind = binding.conditions[0]
+            keyed.setdefault(key, {}).setdefault(value, []).append((position, binding))
+        
+        return bindings, unkeyed, keyed
+    
+    def select(self, data, event=None):
+        """ Return the bindings which could match the given event.
+            
+            Bindings whose indexed option does not match the event are
+            left out. The bindings returned still need to be checked by
+            ``run()``, as only one option of each binding is indexed.
+            
+            Bindings are taken from ``event`` in the event map, which
+            defaults to the name of the event. The event manager gives a
+            pattern here when running bindings for a pattern.
+        """
+        event = event or data.name
+        bindings = self.mapref.get(event, ())
+        
+        if isinstance(bindings, Bindings):
+            snapshot = bindings.snapshot()
+        else:
+            snapshot = tuple(bindings)
+        
+        index = self.lookup.get(event)
+        
+        if index is None or index[0] is not snapshot:
+            index = self.lookup[event] = self.index(snapshot)
+        
+        bindings, unkeyed, keyed = index
+        
+        if not keyed:
+            return bindings
+        
+        found = list(unkeyed)
+        
+        for key, values in keyed.iteritems():
+            try:
+                item = getattr(data, key)
+            except AttributeError:
+                continue
+            
+            try:
+                found.extend(values.get(str(item).lower(), ()))
+            except Exception:
+                for matches in values.itervalues():
+                    found.extend(matches)
+        
+        found.sort()
+        return [binding for position, binding in found]
+    
     def run(self, binding, data, *args):
         """ Run a given event binding.
             
@@ -216,41 +349,72 @@ class Ruleset(object):
               manager's <eventmanager>` ``trigger()`` method.
         """
         
-        for key, option in binding.options.iteritems():
-            # Does the event provide this option?
-            if not hasattr(data, key):
-                return None
-            
-            # Process event item
-            item = getattr(data, key)
-            
-            # Try to match as a string
-            try:
-                if str(item).lower() == str(option).lower():
-                    continue
-            except Exception:
-                pass
-            
-            # Are they the same type?
-            if type(item) != type(option):
-                return None
-            
-            # Do they hold the same value?
-            if item == option:
-                continue
-            
+        if not binding.match(data):
             return None
         
         try:
-            return binding.call(data, *args)
+            return self.call(binding, data, *args)
         except Exception as e:
             # Something failed! Wooo! Should we not capture this?
             log = self._write
-            log('Source "{0}" failed to handle event "{1}"!'.format(binding.source, binding.event))
+            log('Source "{0}" failed to handle event "{1}"!'.format(
+                binding.source or getattr(binding.call, '__name__', binding.call), binding.event))
             log('Error:')
             tb = traceback.format_exc().splitlines()
             for line in tb:
                 log('>> {0}'.format(line))
         return None
+    
+    def call(self, binding, data, *args):
+        """ Call the event handler for a binding.
+            
+            Rulesets should use this method rather than calling
+            ``binding.call`` themselves, so that timings and profiles can be
+            recorded when the event manager asks for them, and so that
+            offloaded bindings are given to the right executor.
+        """
+        if binding.offload is not None:
+            return self.offload(binding, data, *args)
+        
+        timer = self.timer
+        profiler = self.profiler
+        
+        if timer is None and profiler is None:
+            return binding.call(data, *args)
+        
+        clock = (timer or profiler).clock
+        start = clock()
+        failed = True
+        
+        try:
+            result = binding.call(data, *args)
+            failed = False
+            return result
+        finally:
+            elapsed = clock() - start
+            
+            if timer is not None:
+                timer.record('call', binding.event, elapsed)
+            
+            if profiler is not None:
+                profiler.record(binding, elapsed, failed)
+    
+    def offload(self, binding, data, *args):
+        """ Give a binding to the executor named by its ``offload`` option.
+            
+            The executor's ``submit(binding, data, args)`` method is called,
+            and whatever it returns is returned. Executors which run
+            handlers elsewhere will usually return a Deferred.
+            
+            If there is no such executor, the handler is called directly.
+        """
+        try:
+            executor = self.executors[binding.offload]
+        except KeyError:
+            self.debug('>> No executor called "{0}", handling event "{1}" directly.'.format(
+                binding.offload, binding.event))
+            return binding.call(data, *args)
+        
+        return executor.submit(binding, data, args)
 
 # EOF
@@ -11,18 +11,24 @@
 '''
 
 # Standard Lib imports.
+import os
 import sys
 import imp
+import ast
+import time
+import hashlib
 import pkgutil
 import inspect
 import traceback
 from functools import wraps
+from functools import partial
 from collections import Callable
 
 # Reflex imports
 from reflex.data import Event
 from reflex.data import Binding
 from reflex.base import Ruleset
+from reflex.patterns import PatternIndex
 
 
 class EventManager(object):
@@ -76,7 +82,11 @@ class EventManager(object):
         self.debug = stddebug or (lambda n: None)
         self._rules = Ruleset
         self.map = {}
+        self.patterns = PatternIndex()
         self.rules = {}
+        self.timer = None
+        self.profiler = None
+        self.executors = {}
         self.init(*args, **kwargs)
         self.default_ruleset(*args)
     
@@ -98,7 +108,7 @@ class EventManager(object):
             ``rules`` attribute. If any other rulesets were present,
             they will be lost.
         """
-        self.rules = {'default': self._rules(args, kwargs, self.map, self._write, self.debug)}
+        self.rules = {'default': self.attach(self._rules(args, kwargs, self.map, self._write, self.debug))}
     
     def define_rules(self, event, ruleset, *args, **kwargs):
         """ Define a ruleset.
@@ -118,9 +128,70 @@ class EventManager(object):
         """
         if not issubclass(ruleset, Ruleset):
             return False
-        self.rules[event] = ruleset(args, kwargs, self.map, self._write, self.debug)
+        self.rules[event] = self.attach(ruleset(args, kwargs, self.map, self._write, self.debug))
         return True
     
+    def attach(self, ruleset):
+        """ Give a ruleset the hooks used by the event manager.
+            
+            This is called for every ruleset the event manager creates.
+            Returns the given ruleset.
+        """
+        ruleset.timer = self.timer
+        ruleset.profiler = self.profiler
+        ruleset.executors = self.executors
+        return ruleset
+    
+    def set_executor(self, name, executor=None):
+        """ Register an executor for offloaded bindings.
+            
+            Bindings created with the option ``offload=name`` are given to
+            ``executor`` instead of being called directly. The executor must
+            have a ``submit(binding, data, args)`` method. Give ``None`` to
+            remove an executor.
+        """
+        if executor is None:
+            self.executors.pop(name, None)
+            return
+        
+        self.executors[name] = executor
+    
+    def instrument(self, timer=None):
+        """ Record how long it takes to handle events.
+            
+            Input parameters:
+            
+            * **timer** - An object with a ``clock()`` method, which returns
+              the current time in seconds, and a ``record(stage, event,
+              seconds)`` method. An instance of :py:class:`reflex.stats.Timings`
+              can be used here. If ``None`` is given, timings are no longer
+              recorded.
+            
+            Timings are recorded for the stages ``trigger`` (the whole of
+            ``trigger()``), ``run`` (each call to a ruleset's ``run()`` or
+            ``trigger()`` method) and ``call`` (each call to an event handler).
+        """
+        self.timer = timer
+        
+        for name in self.rules:
+            self.attach(self.rules[name])
+    
+    def profile(self, profiler=None):
+        """ Count the calls made to each event binding.
+            
+            Input parameters:
+            
+            * **profiler** - An object with a ``clock()`` method, and a
+              ``record(binding, seconds, failed)`` method which is called
+              after each call to an event handler. An instance of
+              :py:class:`reflex.stats.Profile` can be used here. If ``None``
+              is given, calls are no longer counted.
+        """
+        self.profiler = profiler
+        
+        for name in self.rules:
+            self.attach(self.rules[name])
+    
     def bind(self, method, event, **options):
         """ Bind a method to an event.
             
@@ -130,7 +201,9 @@ class EventManager(object):
               invoked when the event defined in the event parameter is
               triggered.
             * *str* **event** - The event that the method is being bound
-              to.
+              to. This can also be a pattern, using the wildcards of the
+              ``fnmatch`` module. For example, ``'recv_*'`` matches every
+              event whose name starts with ``recv_``.
             * *list* **options** - An iterable of conditions the event
               must meet. If given, then corresponding items provided
               when the event is triggered must match these items.
@@ -151,7 +224,12 @@ class EventManager(object):
         if not isinstance(method, Callable):
             return None
         ruleset = self.rules.get(event, self.rules['default'])
-        return ruleset.bind(method, event, **options)
+        binding = ruleset.bind(method, event, **options)
+        
+        if binding is not None and PatternIndex.wild(event):
+            self.patterns.add(event)
+        
+        return binding
     
     def unbind(self, method, event, **options):
         """ Remove an event binding for a method.
@@ -161,7 +239,12 @@ class EventManager(object):
             for the event.
         """
         ruleset = self.rules.get(event, self.rules['default'])
-        return ruleset.unbind(method, event, **options)
+        removed = ruleset.unbind(method, event, **options)
+        
+        if PatternIndex.wild(event) and not event in self.map:
+            self.patterns.remove(event)
+        
+        return removed
     
     def handler(self, event, **options):
         """ Create an event handler.
@@ -205,26 +288,154 @@ class EventManager(object):
             This method is mainly a wrapper for the ``run()`` method of
             the ruleset object being used for the event defined by the
             object given in the ``data`` parameter.
+            
+            Use ``gather()`` instead to wait for handlers which return
+            Deferreds.
+        """
+        timer = self.timer
+        
+        if timer is None:
+            return self.dispatch(data, *args)
+        
+        start = timer.clock()
+        
+        try:
+            return self.dispatch(data, *args)
+        finally:
+            timer.record('trigger', getattr(data, 'name', None), timer.clock() - start)
+    
+    def gather(self, data, *args, **kwargs):
+        """ Trigger an event, and wait for asynchronous handlers.
+            
+            This works like ``trigger()``, but returns a Twisted Deferred.
+            Event handlers may return Deferreds, or be generators which
+            ``yield`` Deferreds, as with ``inlineCallbacks``. The Deferred
+            returned fires with the list of results from the handlers once
+            they have all finished.
+            
+            Keyword parameters:
+            
+            * *int* **limit** - The most handlers to wait on at once. Further
+              handlers are not called until earlier ones finish.
+            * *float* **timeout** - Seconds to wait for each handler before
+              cancelling it. Handlers which fail or time out are logged and
+              give ``None`` as their result.
+            
+            If a handler stops the event, handlers which have not started
+            yet are skipped, and give ``None`` as their result. Use
+            ``limit=1`` to make sure handlers run one at a time, in order of
+            priority.
+            
+            Twisted is only needed if this method is used.
+        """
+        from reflex.deferred import Gather
+        
+        jobs = []
+        
+        if hasattr(data, 'name'):
+            for key, ruleset, binding in self.candidates(data):
+                if binding is None:
+                    label = 'Event "{0}"'.format(key)
+                    job = partial(ruleset.trigger, data, *args)
+                else:
+                    label = 'Handler {0} for event "{1}"'.format(getattr(binding.call, '__name__', binding.call), key)
+                    job = partial(ruleset.run, binding, data, *args)
+                
+                jobs.append((label, partial(self.proceed, data, job)))
+        
+        return Gather(jobs, kwargs.get('limit'), kwargs.get('timeout'), stdout=self._write).start()
+    
+    def proceed(self, data, job):
+        """ Run a job for ``gather()``, unless the event has been stopped. """
+        if getattr(data, 'stopped', False):
+            return None
+        
+        return job()
+    
+    def candidates(self, data):
+        """ Return the bindings to run for an event, in the order to run them.
+            
+            Returns a list of ``(event, ruleset, binding)`` tuples, where
+            ``event`` is the name of the event, or a pattern matching it,
+            that the binding is stored under. Bindings are ordered by
+            priority, highest first, and then by the order they were made.
+            
+            For rulesets which have their own ``trigger()`` method, a single
+            tuple is given with ``None`` in place of the binding.
         """
-        if not hasattr(data, 'name') or not hasattr(data, 'rules'):
-            return []
         event = data.name
+        keys = [event] if event in self.map else []
+        
+        if self.patterns:
+            keys.extend(self.patterns.resolve(event))
         
-        if not event in self.map.keys():
+        found = []
+        
+        for key in keys:
+            ruleset = self.rules.get(key, self.rules['default'])
+            
+            if hasattr(ruleset, 'trigger'):
+                found.append((key, ruleset, None))
+                continue
+            
+            if hasattr(ruleset, 'select'):
+                bindings = ruleset.select(data, key)
+            else:
+                bindings = self.map[key]
+            
+            found.extend([(key, ruleset, binding) for binding in bindings])
+        
+        if len(keys) > 1:
+            found.sort(key=lambda item: (0, 0) if item[2] is None else item[2].order)
+        
+        return found
+    
+    def dispatch(self, data, *args):
+        """ Run the bindings for an event. Used by ``trigger()``.
+            
+            Bindings for the event and for any patterns matching its name
+            are run in order of priority. If a handler calls the event's
+            ``stop()`` method, no more bindings are run.
+        """
+        # Events are not asked for their rules, as MappedEvent builds them
+        # each time they are read.
+        if not hasattr(data, 'name') or not (isinstance(data, Event) or hasattr(data, 'rules')):
             return []
         
-        ruleset = self.rules.get(event, self.rules['default'])
+        timer = self.timer
+        results = []
         
-        if hasattr(ruleset, 'trigger'):
-            return ruleset.trigger(data, *args)
+        for event, ruleset, binding in self.candidates(data):
+            if timer is not None:
+                start = timer.clock()
+            
+            if binding is None:
+                results.append(ruleset.trigger(data, *args))
+            else:
+                results.append(ruleset.run(binding, data, *args))
+            
+            if timer is not None:
+                timer.record('run', event, timer.clock() - start)
+            
+            if getattr(data, 'stopped', False):
+                break
         
-        return [ruleset.run(binding, data, *args) for binding in self.map[event]]
+        return results
+    
+    def listening(self, event):
+        """ Determine whether or not anything is bound to an event.
+            
+            Applications can use this to avoid creating event objects for
+            events that would not be handled by anything.
+        """
+        return event in self.map or bool(self.patterns and self.patterns.resolve(event))
     
     def clear_bindings(self):
         """ This method removes all event bindings that are being stored
             in the event manager.
         """
         self.map = {}
+        self.patterns = PatternIndex()
         for rule in self.rules:
             self.rules[rule].set_map(self.map)
     
@@ -280,6 +491,11 @@ class PackageBattery(object):
         self.debug = stddebug or (lambda n: None)
         self.modules = {}
         self.loaded = {}
+        self.objects = {}
+        self.stamps = {}
+        self.changed = []
+        self.timings = {}
+        self.inits = {}
         self.init(*args, **kwargs)
     
     def init(self, *args, **kwargs):
@@ -291,21 +507,81 @@ class PackageBattery(object):
         """
         pass
     
+    def find_modules(self, package):
+        """ Return the names of all of the modules in a package. """
+        walker = pkgutil.walk_packages(package.__path__, package.__name__ + '.')
+        return [tup[1] for tup in walker]
+    
+    def stamp(self, module, previous=None):
+        """ Return the modification time and hash of a module's source.
+            
+            The source is only hashed if its modification time is not the
+            same as in ``previous``. ``None`` is returned if the module has
+            no source file.
+        """
+        path = getattr(module, '__file__', None)
+        
+        if path is None:
+            return None
+        
+        if path[-4:] in ('.pyc', '.pyo'):
+            path = path[:-1]
+        
+        try:
+            mtime = os.path.getmtime(path)
+            
+            if previous is not None and previous[0] == mtime:
+                return previous
+            
+            with open(path, 'rb') as file:
+                return (mtime, hashlib.sha1(file.read()).hexdigest())
+        except (IOError, OSError):
+            return None
+    
     def load_modules(self, package, required='ClassName'):
+        """ Import the modules in a package.
+            
+            Modules which were loaded before are only reloaded if their
+            source has changed, going by the modification time and hash of
+            the source file. The names of the modules which were imported or
+            reloaded are stored in ``changed``, and the time taken to import
+            each of them is stored in ``timings``.
+        """
         self.debug('** Checking modules in the {0} package.'.format(package.__name__))
         modules = {}
-        walker = pkgutil.walk_packages(package.__path__, package.__name__ + '.')
-        for tup in walker:
-            name = tup[1]
+        self.changed = []
+        self.timings = {}
+        for name in self.find_modules(package):
             
             self.debug('** Found module \'{0}\'.'.format(name))
-                
+            
+            start = time.time()
+            
             if name in self.modules.keys():
-                self.debug('** Previously loaded module. Reloading!')
-                imp.reload(self.modules[name])
-                modules[name] = self.modules[name]
-                continue
+                mod = self.modules[name]
+                previous = self.stamps.get(name)
+                stamp = self.stamp(mod, previous)
                 
+                if None not in (stamp, previous) and stamp[1] == previous[1]:
+                    self.stamps[name] = stamp
+                    modules[name] = mod
+                    continue
+                
+                self.debug('** Previously loaded module has changed. Reloading!')
+                
+                try:
+                    imp.reload(mod)
+                except Exception:
+                    self.failed('>> Failed to reload module {0}!'.format(name))
+                    modules[name] = mod
+                    continue
+                
+                modules[name] = mod
+                self.stamps[name] = self.stamp(mod)
+                self.changed.append(name)
+                self.timings[name] = time.time() - start
+                continue
+            
             loader = pkgutil.find_loader(name)
             mod = loader.load_module(name)
             
@@ -315,6 +591,9 @@ class PackageBattery(object):
                 continue
             
             modules[name] = mod
+            self.stamps[name] = self.stamp(mod)
+            self.changed.append(name)
+            self.timings[name] = time.time() - start
         self.modules = modules
     
     def load_objects(self, manager, package, cls='ClassName', *args, **kwargs):
@@ -332,29 +611,152 @@ class PackageBattery(object):
             Any extra arguments are passed to the Reactor classes on
             instantiation.
             
+            When this is called again, only modules which are new or have
+            changed are reloaded, and only their objects are replaced. The
+            objects from other modules are left alone. The time taken to
+            reload each module is logged, and kept in ``timings``. The part
+            of that time spent creating the module's object is kept in
+            ``inits``.
         """
-        if self.modules == {}:
+        first = self.modules == {}
+        if first:
             self.log('** Loading {0}s...'.format(cls.lower()))
         self.load_modules(package, cls)
-        self.loaded = {}
-        for name, mod in self.modules.items():
-            try:
-                self.load_object(manager, mod, cls, *args, **kwargs)
-            except Exception as e:
-                self.log('>> Failed to load {0} from {1}!'.format(cls.lower(), name))
-                self.log('>> Error:')
-                tb = traceback.format_exc().splitlines()
-                for line in tb:
-                    self.log('>> {0}'.format(line))
+        self.inits = {}
+        
+        for name in self.objects.keys():
+            if not name in self.modules:
+                self.replace(manager, name, None, cls, *args, **kwargs)
+        
+        for name in self.changed:
+            start = time.time()
+            
+            if not self.replace(manager, name, self.modules[name], cls, *args, **kwargs):
+                self.timings.pop(name, None)
+                continue
+            
+            self.inits[name] = time.time() - start
+            self.timings[name]+= self.inits[name]
+            
+            if not first:
+                self.log('** Reloaded {0} in {1:.1f}ms.'.format(name, self.timings[name] * 1000))
         
         self.debug('** Loaded {0}s: {1}'.format(cls.lower(), ', '.join(self.loaded.keys())))
+    
+    def replace(self, manager, name, module, cls, *args, **kwargs):
+        """ Replace the object loaded from a module.
+            
+            The old object is unloaded before the new one is made, so the
+            two never handle events at the same time. If the new object can
+            not be made, the old one is put back. Otherwise, the old object
+            is discarded. If ``module`` is ``None``, the old object is just
+            unloaded and discarded. Returns ``True`` on success.
+        """
+        old = self.objects.pop(name, None)
+        keys = [key for key, obj in self.loaded.items() if old is not None and obj is old]
+        state = None
         
+        if old is not None:
+            state = self.unload_object(manager, old)
+            
+            for key in keys:
+                del self.loaded[key]
+        
+        if module is None:
+            if old is not None:
+                self.discard_object(manager, old)
+            return True
+        
+        try:
+            self.objects[name] = self.load_object(manager, module, cls, *args, **kwargs)
+        except Exception:
+            self.failed('>> Failed to load {0} from {1}!'.format(cls.lower(), name))
+            self.stamps.pop(name, None)
+            
+            if old is not None:
+                self.restore_object(manager, old, state)
+                self.objects[name] = old
+                
+                for key in keys:
+                    self.loaded[key] = old
+            
+            return False
+        
+        if old is not None:
+            self.discard_object(manager, old)
+        
+        return True
+    
+    def failed(self, message):
+        """ Log a module that failed to load, with the traceback. """
+        self.log(message)
+        self.log('>> Error:')
+        tb = traceback.format_exc().splitlines()
+        for line in tb:
+            self.log('>> {0}'.format(line))
+    
     def load_object(self, manager, module, cls, *args, **kwargs):
         """ Load a single object from a single class. """
         obj = getattr(module, cls)(*args, **kwargs)
         name = str(obj.__class__).split('.')[-2].replace('_', ' ')
         self.loaded[name] = obj
+        return obj
     
+    def unload_object(self, manager, obj):
+        """ Unload an object, before it is replaced.
+            
+            Returns any state needed to put the object back with
+            ``restore_object()``. This is a do-nothing method.
+        """
+        return None
+    
+    def restore_object(self, manager, obj, state):
+        """ Put back an object which failed to be replaced. """
+        pass
+    
+    def discard_object(self, manager, obj):
+        """ Finish unloading an object once it has been replaced.
+            
+            This is a do-nothing method.
+        """
+        pass
+    
+    def read_manifest(self, name):
+        """ Read the manifest of a module without importing it.
+            
+            A manifest is a module-level assignment to ``manifest``, made
+            up only of literals. The module's source is parsed, and the
+            value of the manifest is returned. ``None`` is returned if the
+            module has no manifest, or its source can not be read.
+        """
+        try:
+            source = pkgutil.find_loader(name).get_source(name)
+        except Exception:
+            return None
+        
+        if source is None:
+            return None
+        
+        try:
+            tree = ast.parse(source)
+        except SyntaxError:
+            return None
+        
+        for node in tree.body:
+            if not isinstance(node, ast.Assign):
+                continue
+            
+            if not [target for target in node.targets if isinstance(target, ast.Name) and target.id == 'manifest']:
+                continue
+            
+            try:
+                return ast.literal_eval(node.value)
+            except ValueError:
+                self.debug('>> Manifest of module {0} is not a literal.'.format(name))
+                return None
+        
+        return None
+
         
 class ReactorBattery(PackageBattery):
     """ The Reactor Battery provides a simple way to load
@@ -388,6 +790,42 @@ class ReactorBattery(PackageBattery):
         system you can think up. Or it could be terrible.
     """
     
+    def init(self, lazy=False):
+        self.lazy = lazy
+        self.manifests = {}
+        self.sleeping = {}
+        self.awake = {}
+        self.context = None
+    
+    def find_modules(self, package):
+        """ Find the modules in a package.
+            
+            In lazy mode, modules which have a manifest are left out. Their
+            manifests are stored in ``manifests`` instead, so that the
+            modules can be imported when one of the events listed in their
+            manifest is triggered. Modules which have already been imported
+            are always included, so that they are reloaded as normal.
+        """
+        names = super(ReactorBattery, self).find_modules(package)
+        
+        if not self.lazy:
+            return names
+        
+        found = []
+        self.manifests = {}
+        
+        for name in names:
+            manifest = None if name in self.modules else self.read_manifest(name)
+            
+            if manifest is None:
+                found.append(name)
+                continue
+            
+            self.debug('** Found manifest for module \'{0}\'.'.format(name))
+            self.manifests[name] = manifest
+        
+        return found
+    
     def load_modules(self, package, required='Reactor'):
         super(ReactorBattery, self).load_modules(package, required)
     
@@ -407,13 +845,132 @@ class ReactorBattery(PackageBattery):
             Any extra arguments are passed to the Reactor classes on
             instantiation.
             
+            If the battery was created with ``lazy=True``, modules which
+            have a manifest are not imported here. A manifest is a list of
+            ``(event, options)`` pairs, assigned to ``manifest`` at the top
+            level of the module, like so::
+                
+                manifest = [
+                    ('command', {'cmd': 'join', 'priv': 'Operators'}),
+                    ('recv_join', {}),
+                ]
+            
+            Each pair is bound to a stand-in handler. The first time one of
+            them is triggered, the module is imported, its Reactor is
+            created, and the event is passed to the Reactor's own bindings
+            for the same event and options. Manifests must list the events
+            and options exactly as the Reactor binds them.
         """
+        for name in self.sleeping.keys():
+            self.unbind_stubs(name)
+        
+        self.context = (manager, cls, args, kwargs)
+        self.awake = {}
         super(ReactorBattery, self).load_objects(manager, package, cls, *args, **kwargs)
+        
+        for name, manifest in self.manifests.items():
+            self.sleep(name, manifest)
+        
+        if self.sleeping:
+            self.debug('** Waiting to load: {0}'.format(', '.join(sorted(self.sleeping.keys()))))
     
     def load_object(self, manager, module, cls, *args, **kwargs):
         robj = getattr(module, cls)(manager, *args, **kwargs)
         rname = robj.name
         self.loaded[rname] = robj
+        return robj
+    
+    def unload_object(self, manager, robj):
+        """ Remove the bindings of a Reactor which is being replaced. """
+        return robj.release()
+    
+    def restore_object(self, manager, robj, bindings):
+        """ Put back the bindings of a Reactor which could not be replaced. """
+        robj.restore(bindings)
+    
+    def discard_object(self, manager, robj):
+        """ Let a Reactor know it has been replaced for good. """
+        robj.discard()
+    
+    def sleep(self, name, manifest):
+        """ Bind stand-in handlers for the events in a module's manifest. """
+        manager = self.context[0]
+        stubs = []
+        
+        try:
+            for event, options in manifest:
+                stub = partial(self.on_demand, name, event, dict(options))
+                
+                if manager.bind(stub, event, **options) is not None:
+                    stubs.append((stub, event, options))
+        except (TypeError, ValueError):
+            self.log('>> Invalid manifest in module {0}! Loading it now.'.format(name))
+            self.sleeping[name] = stubs
+            self.wake(name)
+            return
+        
+        self.sleeping[name] = stubs
+    
+    def unbind_stubs(self, name):
+        """ Remove the stand-in handlers for a module. """
+        manager = self.context[0]
+        
+        for stub, event, options in self.sleeping.pop(name, []):
+            manager.unbind(stub, event, **options)
+    
+    def wake(self, name):
+        """ Import a module from its manifest, and load its Reactor.
+            
+            Returns the Reactor, or ``None`` if the module could not be
+            loaded.
+        """
+        if name in self.awake:
+            return self.awake[name]
+        
+        manager, cls, args, kwargs = self.context
+        self.unbind_stubs(name)
+        self.awake[name] = None
+        self.debug('** Loading module \'{0}\' on demand.'.format(name))
+        
+        try:
+            module = pkgutil.find_loader(name).load_module(name)
+            self.awake[name] = self.objects[name] = self.load_object(manager, module, cls, *args, **kwargs)
+            self.modules[name] = module
+            self.stamps[name] = self.stamp(module)
+        except Exception:
+            self.failed('>> Failed to load {0} from {1}!'.format(cls.lower(), name))
+        
+        return self.awake[name]
+    
+    def on_demand(self, name, event, options, data, *args):
+        """ Stand-in handler for an event in a module's manifest.
+            
+            Loads the module, and passes the event on to the bindings the
+            module's Reactor made for the same event and options. The
+            bindings are run with the ruleset's ``run()`` method, so they
+            are checked and accounted for like any other binding.
+        """
+        robj = self.wake(name)
+        
+        if robj is None:
+            return None
+        
+        manager = self.context[0]
+        ruleset = manager.rules.get(event, manager.rules['default'])
+        result = None
+        found = False
+        
+        for binding in list(robj.bindings):
+            if binding.event != event or binding.options != binding.clean(options):
+                continue
+            
+            found = True
+            result = ruleset.run(binding, data, *args)
+        
+        if not found:
+            self.debug('>> Module {0} did not bind "{1}" {2} as its manifest says.'.format(name, event, options))
+        
+        return result
     
         
 class RulesetBattery(PackageBattery):
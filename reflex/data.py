@@ -6,6 +6,12 @@
     Mainly just the Binding and Event classes!
 '''
 
+import threading
+from itertools import count
+from operator import attrgetter
+from collections import OrderedDict
+from collections import Hashable
+
 class Binding(object):
     """ Event binding.
     
@@ -24,28 +30,231 @@ class Binding(object):
           not match, then the handler is not used. Different Rulesets
           can modify this behaviour.
         * *str* **type** - A string representation of the binding.
+        * *str* **offload** - If set, the handler is not called on the
+          calling thread, but is given to the executor registered under this
+          name with the :ref:`event manager <eventmanager>`. For example,
+          ``'thread'``. Handlers run on another thread share their
+          arguments with the calling thread, so they should only use the
+          parts of them which the executor documents as thread-safe.
+        * *int* **priority** - Bindings with a higher priority are run
+          first. Bindings with the same priority are run in the order they
+          were made. The default is ``0``.
+        * *str* **source** - The name of the reactor which made the
+          binding, if any.
+        * **stats** - Counters for the calls made to the handler, when the
+          event manager is profiling. See
+          :py:class:`reflex.stats.Profile`.
         
         The constructor of this class takes the above fields as input,
         apart from ``type``.
+        
+        Options named in ``reserved`` are not conditions. They are removed
+        from ``options`` and stored as attributes of the binding instead.
+        
+        The remaining options are compiled into ``conditions`` when the
+        binding is created, so that ``match()`` can check an event without
+        working out how to compare each option every time.
     """
     
     call = None
     event = None
     options = {}
     type = None
+    offload = None
+    priority = 0
+    reserved = ('offload', 'priority')
+    conditions = ()
+    order = (0, 0)
+    sequence = count()
+    source = None
+    stats = None
     
     def __init__(self, method, event, options):
         """All the given values are stored on instantiation of an event binding."""
         self.call = method
         self.event = event
-        self.options = options
+        self.options = self.clean(options)
         self.type = '<event[\''+event+'\'].binding>'
+        
+        for key in self.reserved:
+            if key in options:
+                setattr(self, key, options[key])
+        
+        self.order = (-self.priority, next(Binding.sequence))
+        self.compile()
         self.init()
+    
+    def settings(self):
+        """ Return the options the binding was made with, reserved or not. """
+        options = dict(self.options)
+        
+        for key in self.reserved:
+            if key in self.__dict__:
+                options[key] = self.__dict__[key]
+        
+        return options
+    
+    @classmethod
+    def clean(cls, options):
+        """ Return a copy of ``options`` without any reserved options. """
+        return dict([(key, value) for key, value in options.items() if not key in cls.reserved])
+    
+    def compile(self):
+        """ Compile ``options`` into ``conditions``.
+            
+            Each condition is a tuple of the option's name, its value, the
+            value as a lower case string, and the type of the value. The
+            lower case string is ``None`` if the value can not be turned
+            into a string. Conditions are sorted by name.
+        """
+        conditions = []
+        
+        for key, option in sorted(self.options.items()):
+            try:
+                lowered = str(option).lower()
+            except Exception:
+                lowered = None
+            
+            conditions.append((key, option, lowered, type(option)))
+        
+        self.conditions = tuple(conditions)
+    
+    def match(self, data):
+        """ Determine whether an event meets the binding's conditions.
+            
+            An event item matches an option if they are the same type and
+            equal, or if they are equal when both are turned into lower
+            case strings. Exact matches are checked first, as they are the
+            cheapest.
+        """
+        for key, option, lowered, kind in self.conditions:
+            try:
+                item = getattr(data, key)
+            except AttributeError:
+                return False
+            
+            if type(item) is kind and item == option:
+                continue
+            
+            if lowered is None:
+                return False
+            
+            try:
+                if str(item).lower() == lowered:
+                    continue
+            except Exception:
+                pass
+            
+            return False
+        
+        return True
         
     def init(self):
         """Overwrite this method when doing stuff on instantiation."""
         pass
 
+class Bindings(object):
+    """ Ordered registry of the bindings for one event.
+        
+        Bindings are stored in an ordered dict, keyed by the binding's
+        handler and a frozen copy of its options. This means duplicates
+        can be found, and bindings removed, without searching through every
+        binding for the event.
+        
+        Readers never see the registry itself. ``snapshot()`` returns a
+        tuple of the bindings, in the order they should run, which is never
+        changed. Adding or removing a binding throws the snapshot away, and
+        a new one is made the next time it is needed. This means bindings
+        can be added or removed while the event is being triggered, even
+        from another thread, without affecting the trigger in progress.
+        Iterating over the registry iterates over the snapshot.
+    """
+    
+    def __init__(self, bindings=()):
+        self.registry = OrderedDict()
+        self.lock = threading.Lock()
+        self.current = ()
+        
+        for binding in bindings:
+            self.add(binding)
+    
+    def __len__(self):
+        return len(self.registry)
+    
+    def __iter__(self):
+        return iter(self.snapshot())
+    
+    def __getitem__(self, index):
+        return self.snapshot()[index]
+    
+    def snapshot(self):
+        """ Return a tuple of the bindings, in the order they should run. """
+        current = self.current
+        
+        if current is not None:
+            return current
+        
+        with self.lock:
+            if self.current is None:
+                self.current = tuple(sorted(self.registry.itervalues(), key=attrgetter('order')))
+            
+            return self.current
+    
+    def __repr__(self):
+        return '<Bindings {0}>'.format(self.registry.values())
+    
+    @classmethod
+    def freeze(cls, value):
+        """ Return a hashable version of an option value. """
+        if isinstance(value, dict):
+            return frozenset([(key, cls.freeze(item)) for key, item in value.items()])
+        
+        if isinstance(value, (list, tuple)):
+            return tuple([cls.freeze(item) for item in value])
+        
+        if isinstance(value, Hashable):
+            return value
+        
+        return repr(value)
+    
+    @classmethod
+    def key(cls, call, options):
+        """ Return the registry key for a handler and its options. """
+        return (call, cls.freeze(options))
+    
+    def add(self, binding):
+        """ Add a binding. Returns ``False`` if it is a duplicate. """
+        key = self.key(binding.call, binding.options)
+        
+        with self.lock:
+            if key in self.registry:
+                return False
+            
+            self.registry[key] = binding
+            self.current = None
+        
+        return True
+    
+    def find(self, call, options):
+        """ Return the binding for a handler and options, or ``None``. """
+        return self.registry.get(self.key(call, options))
+    
+    def remove(self, call, options):
+        """ Remove and return the binding for a handler and options.
+            
+            Returns ``None`` if there is no such binding.
+        """
+        key = self.key(call, options)
+        
+        with self.lock:
+            binding = self.registry.pop(key, None)
+            
+            if binding is not None:
+                self.current = None
+        
+        return binding
+
+
 class Event(object):
     """ Event class.
         
@@ -62,8 +271,13 @@ class Event(object):
         ``data`` parameter should be a list of pairs, defining a key and
         a value each. The object stores these ``(key, value)`` pairs as
         ``obj.<key> = <value>``.
+        
+        A handler can call ``stop()`` to stop the event from being passed
+        to any more handlers.
     """
     
+    stopped = False
+    
     def __init__(self, event, data=[]):
         self.name = event
         self.rules = []
@@ -78,7 +292,61 @@ class Event(object):
         """Overwrite this method if you need to do stuff on instatiation. Do not overwrite __init__."""
         pass
     
+    def stop(self):
+        """ Stop the event from being passed to any more handlers. """
+        self.stopped = True
+    
     def __str__(self):
         return '<event[\'' + self.name + '\']>'
+
+
+class MappedEvent(Event):
+    """ Event which reads its data from a mapping.
+        
+        Instead of copying each item onto the object, this class keeps a
+        reference to the given mapping and looks up attributes in it when
+        they are used. This makes creating the event cheap when the data
+        is already in a dict, like the arguments of a dAmnViper
+        ``PacketEvent``. The constructor takes the following input:
+        
+        * *str* **event** - The name of the event.
+        * *dict* **data** - The mapping holding the event's data. A list of
+          pairs can also be given, as with ``Event``.
+        * *dict* **overlay** - Items which take the place of items in
+          ``data``, without changing ``data`` itself.
+        
+        The mapping is not copied, so it should not be changed while the
+        event is being used. Setting an attribute on the event does not
+        change the mapping.
+    """
+    
+    def __init__(self, event, data=[], overlay=None):
+        self.name = event
+        self.mapping = data if hasattr(data, 'keys') else OrderedDict(data)
+        self.overlay = overlay or {}
+        self.init(event, data)
+    
+    def __getattr__(self, key):
+        if key.startswith('__') or key in ('mapping', 'overlay'):
+            raise AttributeError(key)
+        
+        if key in self.overlay:
+            return self.overlay[key]
+        
+        try:
+            return self.mapping[key]
+        except KeyError:
+            raise AttributeError(key)
+    
+    @property
+    def rules(self):
+        """ The event's values, in the same form as ``Event.rules``. """
+        return [value for key, value in self.items() if not key.lower() in ('rules', 'name')]
+    
+    def items(self):
+        """ Return a list of the event's ``(key, value)`` pairs. """
+        items = [(key, self.overlay.get(key, value)) for key, value in self.mapping.items()]
+        items.extend([(key, value) for key, value in self.overlay.items() if not key in self.mapping])
+        return items
     
 # EOF
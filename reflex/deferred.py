@@ -0,0 +1,126 @@
+''' Deferred support for Reflex.
+    Copyright (c) 2011, Henry "photofroggy" Rapley.
+    Released under the ISC License.
+    
+    This module lets event handlers do asynchronous work using Twisted.
+    Reflex itself does not need Twisted, so this module is only imported
+    when it is used.
+'''
+
+# Standard Lib imports.
+import types
+# Twisted
+from twisted.internet import defer
+
+
+def deferred(result):
+    """ Turn the return value of an event handler into a Deferred.
+        
+        Deferreds are returned as they are. Generators are run with
+        ``inlineCallbacks``, so handlers can ``yield`` Deferreds. Anything
+        else is wrapped in a Deferred which has already fired.
+    """
+    if isinstance(result, defer.Deferred):
+        return result
+    
+    if isinstance(result, types.GeneratorType):
+        return defer.inlineCallbacks(lambda: result)()
+    
+    return defer.succeed(result)
+
+
+class Gather(object):
+    """ Run a set of jobs which may return Deferreds.
+        
+        Each job is a pair of a label, used in log messages, and a callable
+        which takes no arguments. No more than ``limit`` jobs are waited on
+        at once. Jobs which take longer than ``timeout`` seconds are
+        cancelled. Failed and cancelled jobs are logged, and give ``None``
+        as their result.
+        
+        ``start()`` returns a Deferred which fires with a list of the
+        results, in the same order as the jobs, once every job has finished.
+    """
+    
+    def __init__(self, jobs, limit=None, timeout=None, clock=None, stdout=None):
+        self.jobs = list(jobs)
+        self.results = [None] * len(self.jobs)
+        self.limit = limit or len(self.jobs)
+        self.timeout = timeout
+        self.clock = clock
+        self.log = stdout or (lambda m: None)
+        self.next = 0
+        self.running = 0
+        self.finished = 0
+        self.filling = False
+        self.d = defer.Deferred()
+        
+        if timeout is not None and clock is None:
+            from twisted.internet import reactor
+            self.clock = reactor
+    
+    def start(self):
+        """ Start running jobs. Returns a Deferred. """
+        self.fill()
+        return self.d
+    
+    def fill(self):
+        """ Start jobs until the limit is reached. """
+        if self.filling:
+            return
+        
+        self.filling = True
+        
+        while self.running < self.limit and self.next < len(self.jobs):
+            self.launch(self.next)
+            self.next+= 1
+        
+        self.filling = False
+        
+        if self.finished == len(self.jobs) and not self.d.called:
+            self.d.callback(self.results)
+    
+    def launch(self, index):
+        """ Start a single job. """
+        label, job = self.jobs[index]
+        self.running+= 1
+        
+        try:
+            d = deferred(job())
+        except Exception:
+            d = defer.fail()
+        
+        if self.timeout is not None and not d.called:
+            call = self.clock.callLater(self.timeout, d.cancel)
+            d.addBoth(self.disarm, call)
+        
+        d.addCallbacks(self.done, self.failed, callbackArgs=(index,), errbackArgs=(index, label))
+    
+    def disarm(self, result, call):
+        """ Cancel the timeout for a job that has finished. """
+        if call.active():
+            call.cancel()
+        
+        return result
+    
+    def done(self, result, index):
+        """ Store the result of a job. """
+        self.results[index] = result
+        self.running-= 1
+        self.finished+= 1
+        self.fill()
+    
+    def failed(self, failure, index, label):
+        """ Log a job which failed or timed out. """
+        if failure.check(defer.CancelledError):
+            self.log('>> {0} timed out after {1}s.'.format(label, self.timeout))
+        else:
+            self.log('>> {0} failed!'.format(label))
+            self.log('>> Error:')
+            for line in failure.getTraceback().splitlines():
+                self.log('>> {0}'.format(line))
+        
+        self.done(None, index)
+
+
+# EOF
@@ -0,0 +1,120 @@
+''' Reflex event patterns.
+    Copyright (c) 2011, Henry "photofroggy" Rapley.
+    Released under the ISC License.
+    
+    This module allows event handlers to be bound to patterns, like
+    ``recv_*``, instead of single event names. Patterns use the same
+    wildcards as ``fnmatch``.
+'''
+
+# Standard Lib imports.
+import re
+import fnmatch
+
+
+class PatternIndex(object):
+    """ Index of event name patterns.
+        
+        Patterns are stored in a trie, keyed by the part of the pattern
+        before the first wildcard. Resolving an event name walks down the
+        trie once, collecting the patterns whose prefix matches, and checks
+        the rest of each of those patterns. The result for each event name
+        is cached until a pattern is added or removed, so after the first
+        time an event is seen, resolving it is a single dict lookup.
+    """
+    
+    wildcards = re.compile(r'[*?[]')
+    cache_size = 1024
+    
+    def __init__(self):
+        self.root = {}
+        self.patterns = {}
+        self.cache = {}
+    
+    def __len__(self):
+        return len(self.patterns)
+    
+    def __contains__(self, pattern):
+        return pattern in self.patterns
+    
+    @classmethod
+    def wild(cls, name):
+        """ Determine whether an event name is a pattern. """
+        return cls.wildcards.search(name) is not None
+    
+    def add(self, pattern):
+        """ Add a pattern to the index. """
+        if pattern in self.patterns:
+            return
+        
+        prefix = pattern[:self.wildcards.search(pattern).start()]
+        rest = pattern[len(prefix):]
+        
+        if rest == '*':
+            matcher = None
+        else:
+            matcher = re.compile(fnmatch.translate(pattern)).match
+        
+        self.patterns[pattern] = (prefix, matcher)
+        node = self.root
+        
+        for char in prefix:
+            node = node.setdefault(char, {})
+        
+        node.setdefault(None, []).append(pattern)
+        self.cache = {}
+    
+    def remove(self, pattern):
+        """ Remove a pattern from the index. """
+        if not pattern in self.patterns:
+            return
+        
+        prefix, matcher = self.patterns.pop(pattern)
+        path = [self.root]
+        
+        for char in prefix:
+            path.append(path[-1][char])
+        
+        path[-1][None].remove(pattern)
+        
+        if not path[-1][None]:
+            del path[-1][None]
+        
+        # Prune branches which no longer lead to any patterns.
+        for depth in range(len(prefix), 0, -1):
+            if path[depth]:
+                break
+            del path[depth - 1][prefix[depth - 1]]
+        
+        self.cache = {}
+    
+    def resolve(self, name):
+        """ Return a tuple of the patterns which match an event name. """
+        try:
+            return self.cache[name]
+        except KeyError:
+            pass
+        
+        found = []
+        node = self.root
+        
+        for char in name:
+            found.extend(node.get(None, ()))
+            node = node.get(char)
+            
+            if node is None:
+                break
+        else:
+            found.extend(node.get(None, ()))
+        
+        found = [pattern for pattern in found if self.patterns[pattern][1] is None
+            or self.patterns[pattern][1](name)]
+        
+        if len(self.cache) >= self.cache_size:
+            self.cache = {}
+        
+        result = self.cache[name] = tuple(sorted(found))
+        return result
+
+
+# EOF
@@ -0,0 +1,290 @@
+''' Reflex statistics.
+    Copyright (c) 2011, Henry "photofroggy" Rapley.
+    Released under the ISC License.
+    
+    This module provides cheap histograms for recording how long things
+    take, an object which collects these histograms for the different
+    stages of an event pipeline, and a profile of the calls made to each
+    event binding.
+'''
+
+# Standard Lib imports.
+import math
+import time
+from timeit import default_timer
+
+
+class Histogram(object):
+    """ Histogram of durations.
+        
+        Values are counted in buckets which grow exponentially, four buckets
+        to every doubling, starting from ``base`` seconds. This means that
+        percentiles are accurate to within about 20%, no matter how many
+        values are recorded, while recording a value stays cheap.
+        
+        The exact count, total and maximum of the values are also kept.
+    """
+    
+    base = 1e-6
+    scale = 4 / math.log(2)
+    
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = {}
+    
+    def add(self, value):
+        """ Record a value. """
+        self.count+= 1
+        self.total+= value
+        
+        if value > self.max:
+            self.max = value
+        
+        index = int(math.log(value / self.base) * self.scale) if value > self.base else 0
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+    
+    def merge(self, other):
+        """ Add the values recorded by another histogram to this one. """
+        self.count+= other.count
+        self.total+= other.total
+        self.max = max(self.max, other.max)
+        
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+    
+    def mean(self):
+        """ Return the mean of the recorded values. """
+        return self.total / self.count if self.count else 0.0
+    
+    def percentile(self, p):
+        """ Return an estimate of the ``p``th percentile of the values. """
+        if not self.count:
+            return 0.0
+        
+        target = self.count * p / 100.0
+        seen = 0
+        
+        for index in sorted(self.buckets):
+            seen+= self.buckets[index]
+            
+            if seen >= target:
+                return min(self.base * math.exp((index + 1) / self.scale), self.max)
+        
+        return self.max
+    
+    def summary(self):
+        """ Return a short summary of the histogram, in milliseconds. """
+        return '{0} calls, mean {1:.3f}ms, p50 {2:.3f}ms, p99 {3:.3f}ms, max {4:.3f}ms'.format(
+            self.count,
+            self.mean() * 1000,
+            self.percentile(50) * 1000,
+            self.percentile(99) * 1000,
+            self.max * 1000
+        )
+
+
+class Timings(object):
+    """ Timings for the stages of an event pipeline.
+        
+        Objects which support timing hooks, like the
+        :ref:`event manager <eventmanager>`, call ``record`` with the name of
+        a stage, the name of the event being processed, and the time the
+        stage took. A histogram is kept for each pair of stage and event
+        name.
+        
+        Anything using the hooks should get the current time from ``clock``
+        so that all of the timings are comparable.
+    """
+    
+    clock = staticmethod(default_timer)
+    
+    def __init__(self):
+        self.data = {}
+        self.started = time.time()
+    
+    def record(self, stage, name, elapsed):
+        """ Record the time taken by a stage for an event. """
+        try:
+            self.data[(stage, name)].add(elapsed)
+        except KeyError:
+            histogram = self.data[(stage, name)] = Histogram()
+            histogram.add(elapsed)
+    
+    def reset(self):
+        """ Forget all recorded timings. """
+        self.data = {}
+        self.started = time.time()
+    
+    def stages(self):
+        """ Return a dict mapping stage names to histograms for all events. """
+        stages = {}
+        
+        for (stage, name), histogram in self.data.items():
+            if not stage in stages:
+                stages[stage] = Histogram()
+            stages[stage].merge(histogram)
+        
+        return stages
+    
+    def report(self):
+        """ Return a list of lines describing the recorded timings. """
+        lines = ['Timings since {0}'.format(time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.started)))]
+        
+        for stage, histogram in sorted(self.stages().items()):
+            lines.append('{0}: {1}'.format(stage, histogram.summary()))
+        
+        for (stage, name), histogram in sorted(self.data.items()):
+            lines.append('{0} {1}: {2}'.format(stage, name, histogram.summary()))
+        
+        return lines
+    
+    def dump(self, path):
+        """ Append the report to the file at ``path``. """
+        with open(path, 'a') as file:
+            file.write('\n'.join(self.report()))
+            file.write('\n\n')
+
+
+class CallStats(object):
+    """ Counters for the calls made to an event handler.
+        
+        * **calls** - A :py:class:`Histogram <reflex.stats.Histogram>` of
+          how long each call took. This holds the number of calls and the
+          total, maximum and percentiles of their durations.
+        * *int* **errors** - The number of calls which raised an exception.
+        * *str* **source** and *str* **event** - The source and event of
+          the bindings counted, when kept by a
+          :py:class:`Profile <reflex.stats.Profile>`.
+    """
+    
+    def __init__(self, source=None, event=None, epoch=None):
+        self.calls = Histogram()
+        self.errors = 0
+        self.source = source
+        self.event = event
+        self.epoch = epoch
+    
+    def merge(self, other):
+        """ Add the counters from another object to this one. """
+        self.calls.merge(other.calls)
+        self.errors+= other.errors
+    
+    def summary(self):
+        """ Return a short summary of the counters, in milliseconds. """
+        return '{0} calls, {1} errors, {2:.1f}ms total, p99 {3:.3f}ms, max {4:.3f}ms'.format(
+            self.calls.count,
+            self.errors,
+            self.calls.total * 1000,
+            self.calls.percentile(99) * 1000,
+            self.calls.max * 1000
+        )
+
+
+class Profile(object):
+    """ Profile of the calls made to each event binding.
+        
+        When given to the :ref:`event manager <eventmanager>` with
+        ``profile()``, rulesets call ``record`` every time they call an
+        event handler. The counters for each binding are kept in the
+        binding's ``stats`` attribute, so recording a call does not need to
+        look anything up.
+        
+        The profile itself keeps the counters by the binding's label, and
+        does not keep the bindings. Bindings which are unbound can be
+        released, along with the reactors they belong to. When a reactor is
+        reloaded, the counters for its new bindings carry on from the old
+        ones.
+        
+        Only the time spent in the handler itself is recorded. Handlers
+        which return Deferreds, or are offloaded, are timed up to the point
+        they return.
+    """
+    
+    clock = staticmethod(default_timer)
+    
+    def __init__(self):
+        self.stats = {}
+        self.epoch = object()
+        self.started = time.time()
+    
+    def record(self, binding, elapsed, failed=False):
+        """ Record a call to the handler of a binding. """
+        stats = binding.stats
+        
+        if stats is None or stats.epoch is not self.epoch:
+            stats = binding.stats = self.counters(binding)
+        
+        stats.calls.add(elapsed)
+        
+        if failed:
+            stats.errors+= 1
+    
+    def counters(self, binding):
+        """ Return the counters for a binding, creating them if needed. """
+        label = self.label(binding)
+        
+        try:
+            return self.stats[label]
+        except KeyError:
+            stats = self.stats[label] = CallStats(binding.source, binding.event, self.epoch)
+            return stats
+    
+    def reset(self):
+        """ Forget all recorded calls. """
+        self.stats = {}
+        self.epoch = object()
+        self.started = time.time()
+    
+    def group(self, key):
+        """ Return a dict of counters, merged by ``key(stats)``. """
+        groups = {}
+        
+        for stats in self.stats.itervalues():
+            name = key(stats)
+            
+            if not name in groups:
+                groups[name] = CallStats()
+            groups[name].merge(stats)
+        
+        return groups
+    
+    def label(self, binding):
+        """ Return a name for a binding, for use in reports. """
+        return '{0} {1} {2}'.format(binding.source or '-',
+            getattr(binding.call, '__name__', binding.call), binding.type)
+    
+    def report(self, rules=(), top=20):
+        """ Return a list of lines describing the recorded calls.
+            
+            Calls are totalled for each ruleset and each reactor, and the
+            ``top`` bindings with the most time spent in them are listed.
+            ``rules`` is the list of event names which have their own
+            ruleset. Other bindings are counted under ``default``.
+        """
+        lines = ['Profile since {0}'.format(time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.started)))]
+        ranked = lambda groups: sorted(groups.items(), key=lambda item: item[1].calls.total, reverse=True)
+        
+        lines.append('Rulesets:')
+        for name, stats in ranked(self.group(lambda s: s.event if s.event in rules else 'default')):
+            lines.append('  {0}: {1}'.format(name, stats.summary()))
+        
+        lines.append('Reactors:')
+        for name, stats in ranked(self.group(lambda s: s.source or '-')):
+            lines.append('  {0}: {1}'.format(name, stats.summary()))
+        
+        lines.append('Bindings:')
+        for label, stats in sorted(self.stats.items(), key=lambda item: item[1].calls.total, reverse=True)[:top]:
+            lines.append('  {0}: {1}'.format(label, stats.summary()))
+        
+        return lines
+    
+    def dump(self, path, rules=()):
+        """ Append the report to the file at ``path``. """
+        with open(path, 'a') as file:
+            file.write('\n'.join(self.report(rules)))
+            file.write('\n\n')
+
+
+# EOF
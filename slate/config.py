@@ -11,8 +11,6 @@ import json
 from twisted.internet import defer
 from twisted.internet import reactor
 
-from dAmnViper.dA.api import APIClient
-
 # slate's stdlib
 from slate.misc_lib import get_input
 from slate.misc_lib import export_struct
@@ -32,6 +30,9 @@ class Settings:
     trigger = None
     autojoin = None
     file = None
+    workers = None
+    inbound = None
+    extensions = None
     
     def __init__(self, file='./storage/config.bsv'):
         self.file = file
@@ -39,6 +40,9 @@ class Settings:
         self.owner = None
         self.trigger = None
         self.autojoin = []
+        self.workers = {'threads': 4, 'processes': 2, 'queue': 64, 'limit': 0}
+        self.inbound = {'limit': 1000, 'batch': 50, 'weights': {}}
+        self.extensions = {'lazy': False}
         self.load()
     
     def load(self):
@@ -57,6 +61,17 @@ class Settings:
         self.owner = data['owner']
         self.trigger = data['trigger']
         self.autojoin = data['autojoin']
+        self.workers.update(data.get('workers', {}))
+        self.inbound.update(data.get('inbound', {}))
+        self.extensions.update(data.get('extensions', {}))
+        # export_struct writes numbers as strings, so turn them back.
+        self.workers['threads'] = int(self.workers['threads'])
+        self.workers['queue'] = int(self.workers['queue'])
+        self.workers['processes'] = int(self.workers['processes'])
+        self.workers['limit'] = int(self.workers['limit'])
+        self.inbound['limit'] = int(self.inbound['limit'])
+        self.inbound['batch'] = int(self.inbound['batch'])
+        self.inbound['weights'] = dict([(ns, float(weight)) for ns, weight in self.inbound['weights'].items()])
     
     def save(self):
         data = {
@@ -70,7 +85,10 @@ class Settings:
             },
             'autojoin': self.autojoin,
             'owner': self.owner,
-            'trigger': self.trigger
+            'trigger': self.trigger,
+            'workers': self.workers,
+            'inbound': self.inbound,
+            'extensions': self.extensions
         }
         file = open(self.file, 'w')
         file.write(export_struct(data))
@@ -100,6 +118,10 @@ class Configure:
         
         self.data = Settings(self.file)
         
+        # The API client needs twisted.web, which a configured bot never
+        # uses, so it is only imported when the configuration is run.
+        from dAmnViper.dA.api import APIClient
+        
         self.api = APIClient(_reactor, id, secret, self.data.api.code, self.data.api.token, agent)
         self.port = port
         self.state = state
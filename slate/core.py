@@ -10,6 +10,8 @@ import platform
 from twisted.internet import reactor
 
 from stutter import logging
+from reflex.stats import Timings
+from reflex.stats import Profile
 from reflex.control import EventManager
 from reflex.control import RulesetBattery
 from reflex.control import ReactorBattery
@@ -19,6 +21,11 @@ from slate.custom import Client
 from slate.custom import ChannelLogger
 from slate.config import Settings
 from slate.config import Configure
+from slate.workers import ThreadPool
+from slate.workers import ProcessPool
+from slate.watchdog import Watchdog
+from slate.inbound import EventQueue
+from slate import startup
 
 from slate import rules
 import extensions
@@ -41,6 +48,13 @@ class Bot(object):
     client = None
     events = None
     agent = None
+    timings = None
+    timings_task = None
+    profile = None
+    profile_task = None
+    threads = None
+    processes = None
+    watchdog = None
     
     debug = False
     restartable = False
@@ -51,12 +65,14 @@ class Bot(object):
         self.platform.stamp = time.strftime('%d%m%Y-%H%M%S')
         self.debug = debug
         self.restartable = restartable
+        startup.mark('core imported')
         
         logging.LEVEL.MESSAGE+= logging.LEVEL.WARNING
         logging.LEVEL.WARNING = logging.LEVEL.MESSAGE - logging.LEVEL.WARNING
         logging.LEVEL.MESSAGE-= logging.LEVEL.WARNING
         
         self.populate_objects()
+        startup.mark('objects created')
         
         if debug:
             self.log.set_level(logging.LEVEL.DEBUG)
@@ -75,16 +91,48 @@ class Bot(object):
         self.users = UserManager(stdout=self.log.message, stddebug=self.log.debug)
         self.users.load()
         self.events = EventManager(stdout=self.log.message, stddebug=self.log.debug)
+        
+        self.threads = ThreadPool(
+            self.config.workers['threads'],
+            self.config.workers['queue'],
+            stdout=self.log.message
+        )
+        self.processes = ProcessPool(
+            self.config.workers['processes'],
+            self.config.workers['queue'],
+            stdout=self.log.message
+        )
+        self.events.set_executor('thread', self.threads)
+        self.events.set_executor('process', self.processes)
+        self.watchdog = Watchdog(stdout=self.log.warning)
         self.client = Client(
             stdout=self.log.message,
             stddebug=self.log.debug,
             _events=self.events,
             _teardown=self.teardown,
         )
+        self.client.inbound = EventQueue(
+            self.events.trigger,
+            self.config.inbound['limit'],
+            self.config.inbound['batch'],
+            stdout=self.log.warning,
+            weights=self.config.inbound['weights'],
+            namespace=self.client.deform_ns
+        )
         self.rules = RulesetBattery(stdout=self.log.message, stddebug=self.log.debug)
-        self.exts = ReactorBattery(stdout=self.log.message, stddebug=self.log.debug)
+        self.exts = ReactorBattery(
+            stdout=self.log.message,
+            stddebug=self.log.debug,
+            lazy=self.config.extensions['lazy']
+        )
         self.rules.load_objects(self.events, rules, core=self)
+        startup.mark('rulesets loaded')
         self.exts.load_objects(self.events, extensions, 'Extension', self)
+        startup.mark('extensions loaded')
+        # Fork the worker processes now, while there is no reactor running
+        # and no other threads have been started.
+        self.processes.start()
+        startup.mark('worker processes started')
     
     
     def start_configure(self):
@@ -149,7 +197,11 @@ class Bot(object):
         
         self.users.load(owner=self.config.owner)
         
+        self.watchdog.start()
+        startup.mark('connecting')
         self.client.start()
+        # Startup is finished once the reactor is running.
+        reactor.callLater(0, self.profiled)
         
         try:
             reactor.run()
@@ -159,6 +211,10 @@ class Bot(object):
     def teardown(self):
         self.close = self.client.flag.close
         self.restart = self.client.flag.restart
+        self.threads.stop()
+        self.processes.stop()
+        self.watchdog.stop()
+        self.profiled('shutting down')
         
         try:
             reactor.stop()
@@ -169,6 +225,106 @@ class Bot(object):
         self.log.stop()
         self.log.push(0)
     
+    def profiled(self, milestone='reactor running'):
+        """ Stop the startup profiler and write the startup profile.
+            
+            Does nothing if the profiler is not enabled, or has already
+            been stopped. ``milestone`` is recorded as the end of startup.
+        """
+        if startup.profiler is None or startup.profiler.original is None:
+            return
+        
+        startup.mark(milestone)
+        startup.profiler.uninstall()
+        
+        try:
+            startup.profiler.write('./storage', '{0}.{1}'.format(self.platform.version, self.platform.build),
+                [('Ruleset', self.rules), ('Extension', self.exts)])
+        except IOError as e:
+            self.log.warning('>> Could not write startup profile: {0}'.format(e), showns=False)
+            return
+        
+        self.log.message('** Startup profile written to storage/startup.txt.', showns=False)
+    
+    def reload_extensions(self):
+        """ Reload the extensions which have changed.
+            
+            Returns a dict of the modules which were reloaded, and how long
+            each one took to reload, in seconds.
+        """
+        self.exts.load_objects(self.events, extensions, 'Extension', self)
+        return self.exts.timings
+    
+    def enable_timings(self, period=None, file='./storage/timings.txt'):
+        """ Start recording how long each stage of the event pipeline takes.
+            
+            If ``period`` is given, the timings are written to ``file`` every
+            ``period`` seconds.
+        """
+        if self.timings is None:
+            self.timings = Timings()
+        
+        self.client.timer = self.timings
+        self.events.instrument(self.timings)
+        
+        if self.timings_task is not None:
+            self.timings_task.cancel()
+            self.timings_task = None
+        
+        if period:
+            self.timings_task = self.client.scheduler.call_every(period, self.dump_timings, file)
+    
+    def disable_timings(self):
+        """ Stop recording timings. Recorded timings are kept. """
+        self.client.timer = None
+        self.events.instrument(None)
+        
+        if self.timings_task is not None:
+            self.timings_task.cancel()
+            self.timings_task = None
+    
+    def dump_timings(self, file='./storage/timings.txt'):
+        """ Write the recorded timings to a file. """
+        if self.timings is None:
+            return False
+        
+        self.timings.dump(file)
+        return True
+    
+    def enable_profile(self, period=None, file='./storage/profile.txt'):
+        """ Start counting the calls made to each event handler.
+            
+            If ``period`` is given, the profile is written to ``file`` every
+            ``period`` seconds.
+        """
+        if self.profile is None:
+            self.profile = Profile()
+        
+        self.events.profile(self.profile)
+        
+        if self.profile_task is not None:
+            self.profile_task.cancel()
+            self.profile_task = None
+        
+        if period:
+            self.profile_task = self.client.scheduler.call_every(period, self.dump_profile, file)
+    
+    def disable_profile(self):
+        """ Stop counting calls. Counted calls are kept. """
+        self.events.profile(None)
+        
+        if self.profile_task is not None:
+            self.profile_task.cancel()
+            self.profile_task = None
+    
+    def dump_profile(self, file='./storage/profile.txt'):
+        """ Write the profile to a file. """
+        if self.profile is None:
+            return False
+        
+        self.profile.dump(file, self.events.rules.keys())
+        return True
+    
     def write(self, msg, *args, **kwargs):
         try:
             sys.stdout.write(msg)
@@ -13,7 +13,7 @@ from threading import BoundedSemaphore
 from twisted.internet import reactor
 
 from stutter import logging
-from reflex.data import Event
+from reflex.data import MappedEvent
 from dAmnViper.base import dAmnClient
 
 from slate.rules.command.data import Command
@@ -86,6 +86,8 @@ class ChannelLogger(logging.ThreadedLogger):
 
 class Client(dAmnClient):
     
+    inbound = None
+    
     def init(self, stddebug=None, _events=None, _teardown=None):
         if stddebug is None:
             def debug(*args, **kwargs):
@@ -123,9 +125,22 @@ class Client(dAmnClient):
         self.stdout(msg, ns=ns, showns=showns)
     
     def pkt_generic(self, event):
-        self._events.trigger(Event(event.name, event.arguments.items()), self)
+        if not self._events.listening(event.name):
+            return
+        
+        self.dispatch(MappedEvent(event.name, event.arguments))
     
     def pkt_recv_msg(self, event):
+        """ Trigger a ``command`` event for messages starting with the trigger.
+            
+            A command message gives two event objects: the ``recv_msg``
+            event made by ``pkt_generic``, and the ``Command``. They are
+            triggered under different names, and each may wait in the
+            inbound queue on its own, so one object can not be used for
+            both. Neither copies the packet's arguments. Both read them
+            through the same mapping, and the command's items are kept in
+            its overlay.
+        """
         if not event.arguments['message'].lower().startswith(self.trigger):
             return
         
@@ -136,12 +151,24 @@ class Client(dAmnClient):
         if msg.startswith('#') or msg.startswith('@'):
             target, sp, msg = msg.partition(' ')
         
-        event.arguments['trigger'] = cmd
-        event.arguments['target'] = self.format_ns(target)
-        event.arguments['message'] = msg
+        self.dispatch(Command('command', event.arguments, {
+            'trigger': cmd,
+            'target': self.format_ns(target),
+            'message': msg
+        }))
+    
+    def dispatch(self, event):
+        """ Trigger an event.
+            
+            If the client has an :py:class:`inbound queue
+            <slate.inbound.EventQueue>`, the event is put on the queue
+            instead of being triggered straight away.
+        """
+        if self.inbound is None:
+            self._events.trigger(event, self)
+            return
         
-        cobj = Command('command', event.arguments.items())
-        self._events.trigger(cobj, self)
+        self.inbound.put(event, self)
 
 
 # EOF
\ No newline at end of file
@@ -12,7 +12,37 @@ class ExtensionBase(Reactor):
     def __init__(self, manager, core):
         self.core = core
         self.log = core.log
+        self.scheduler = core.client.scheduler
         super(ExtensionBase, self).__init__(manager, core)
+    
+    def call_later(self, delay, method, *args, **kwargs):
+        """ Call a method once, after ``delay`` seconds. """
+        return self.own(self.scheduler.call_later(delay, method, *args, **kwargs))
+    
+    def call_every(self, interval, method, *args, **kwargs):
+        """ Call a method every ``interval`` seconds. """
+        return self.own(self.scheduler.call_every(interval, method, *args, **kwargs))
+    
+    def call_cron(self, spec, method, *args, **kwargs):
+        """ Call a method on a cron-like schedule, like ``'*/5 * * * *'``. """
+        return self.own(self.scheduler.call_cron(spec, method, *args, **kwargs))
+    
+    def own(self, task):
+        """ Mark a scheduled task as belonging to this extension. """
+        task.owner = self
+        return task
+    
+    def cancel_tasks(self):
+        """ Cancel every task scheduled by this extension. """
+        self.scheduler.cancel_owner(self)
+    
+    def discard(self):
+        """ Cancel the extension's tasks once it has been replaced.
+            
+            This is not done when the extension's bindings are released, as
+            the extension is put back if its replacement fails to load.
+        """
+        self.cancel_tasks()
 
 
 
@@ -0,0 +1,278 @@
+''' slate.inbound
+    Inbound event queue.
+    Created by photofroggy.
+    
+    Events from the client are queued here before being triggered, so that
+    a flood of packets does not turn into a flood of handler calls all made
+    in one go, and so that one busy channel can not starve the others.
+'''
+
+import traceback
+from collections import deque
+from twisted.internet import reactor
+
+from reflex.stats import Histogram
+
+
+NEVER = 'never'
+COALESCE = 'coalesce'
+DROP = 'drop'
+
+
+class Lane(object):
+    """ The queue of events waiting for one channel.
+        
+        * *str* **ns** - The channel, in lower case. Events which do not
+          belong to a channel share the lane ``''``.
+        * *float* **weight** - How many events the lane may trigger in each
+          round, relative to other lanes.
+        * **latency** - A :py:class:`Histogram <reflex.stats.Histogram>` of
+          how long events waited in the lane before being triggered.
+    """
+    
+    def __init__(self, ns, weight=1):
+        if not weight > 0:
+            raise ValueError('Channel weights must be greater than 0')
+        
+        self.ns = ns
+        self.weight = weight
+        self.deficit = 0
+        self.queue = deque()
+        self.served = 0
+        self.dropped = 0
+        self.latency = Histogram()
+
+
+class EventQueue(object):
+    """ Bounded, fair queue of events waiting to be triggered.
+        
+        Events are put on the queue with ``put``, and triggered in batches
+        of ``batch`` events. Each batch is run in its own reactor iteration,
+        so the reactor can read from the network and run other delayed
+        calls between batches.
+        
+        Each channel has its own :py:class:`Lane <slate.inbound.Lane>`, and
+        lanes are served with deficit round robin. In each round, a lane
+        may trigger as many events as its weight, so a channel with a
+        weight of ``2`` gets twice the handler time of a channel with a
+        weight of ``1`` when both are busy, and a quiet channel never waits
+        behind more than one round of a busy one. Weights are looked up in
+        ``weights`` by channel name, like ``'#botdom'``. Events carry raw
+        namespaces, like ``chat:Botdom``, so lanes are keyed by passing
+        every namespace through ``namespace`` and lower casing the result.
+        
+        What happens to an event depends on the policy for its name, which
+        is looked up in ``policies``:
+        
+        * ``never`` - The event is always queued, even when the queue is
+          full. Used for events the bot needs to keep track of its own
+          state.
+        * ``coalesce`` - If an event for the same user in the same channel
+          is already waiting, it is replaced by the new event. This turns a
+          storm of joins and parts into one event per user.
+        * ``drop`` - The default. The event is dropped if the queue is full.
+        
+        Input parameters:
+        
+        * *callable* **trigger** - Called with each event and its arguments.
+          Usually the event manager's ``trigger`` method.
+        * *int* **limit** - The number of events the queue can hold, across
+          all channels.
+        * *int* **batch** - The number of events triggered at a time.
+        * *callable* **stdout** - Method used to log errors and load
+          shedding.
+        * *dict* **policies** - Policies to use in place of the defaults.
+        * *dict* **weights** - Weights for channels. Channels not listed
+          have a weight of ``1``.
+        * *callable* **namespace** - Turns a namespace into the form used
+          for lane keys. Usually the client's ``deform_ns`` method.
+    """
+    
+    policies = {
+        'ping': NEVER,
+        'disconnect': NEVER,
+        'property': NEVER,
+        'login': NEVER,
+        'join': NEVER,
+        'part': NEVER,
+        'kicked': NEVER,
+        'recv_join': COALESCE,
+        'recv_part': COALESCE,
+    }
+    
+    def __init__(self, trigger, limit=1000, batch=50, stdout=None, policies=None, weights=None, clock=None, namespace=None):
+        self.trigger = trigger
+        self.limit = int(limit)
+        self.batch = int(batch)
+        self.log = stdout or (lambda m, **kwargs: None)
+        self.clock = clock or reactor
+        self.namespace = namespace or str
+        self.policies = dict(self.policies)
+        self.policies.update(policies or {})
+        self.weights = dict([(self.key(ns), float(weight)) for ns, weight in (weights or {}).items()])
+        self.lanes = {}
+        self.active = deque()
+        self.keys = {}
+        self.length = 0
+        self.pending = None
+        self.shedding = False
+        
+        self.peak = 0
+        self.queued = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.drops = {}
+    
+    def __len__(self):
+        return self.length
+    
+    def key(self, ns):
+        """ Return the lane key for a namespace. """
+        if not ns:
+            return ''
+        
+        return str(self.namespace(ns)).lower()
+    
+    def lane(self, ns):
+        """ Return the lane for a channel, creating it if needed. """
+        try:
+            return self.lanes[ns]
+        except KeyError:
+            lane = self.lanes[ns] = Lane(ns, self.weights.get(ns, 1))
+            return lane
+    
+    def weigh(self, ns, weight):
+        """ Set the weight of a channel. """
+        if not weight > 0:
+            raise ValueError('Channel weights must be greater than 0')
+        
+        ns = self.key(ns)
+        self.weights[ns] = weight
+        self.lane(ns).weight = weight
+    
+    def put(self, event, *args):
+        """ Queue an event to be triggered with the given arguments. """
+        policy = self.policies.get(event.name, DROP)
+        ns = self.key(getattr(event, 'ns', ''))
+        key = None
+        
+        if policy == COALESCE:
+            key = (ns, str(getattr(event, 'user', '')).lower())
+            entry = self.keys.get(key)
+            
+            if entry is not None:
+                entry[1] = event
+                entry[2] = args
+                self.coalesced+= 1
+                return
+        
+        lane = self.lane(ns)
+        
+        if policy != NEVER and self.length >= self.limit:
+            lane.dropped+= 1
+            self.shed(event)
+            return
+        
+        entry = [key, event, args, self.clock.seconds()]
+        
+        if not lane.queue:
+            self.active.append(lane)
+        
+        lane.queue.append(entry)
+        self.length+= 1
+        self.queued+= 1
+        self.peak = max(self.peak, self.length)
+        
+        if key is not None:
+            self.keys[key] = entry
+        
+        self.schedule()
+    
+    def shed(self, event):
+        """ Drop an event because the queue is full. """
+        self.dropped+= 1
+        self.drops[event.name] = self.drops.get(event.name, 0) + 1
+        
+        if self.shedding:
+            return
+        
+        self.shedding = True
+        self.log('>> Inbound queue is full ({0} events), dropping events.'.format(self.limit), showns=False)
+    
+    def schedule(self):
+        """ Make sure a drain is scheduled. """
+        if self.pending is None:
+            self.pending = self.clock.callLater(0, self.drain)
+    
+    def drain(self):
+        """ Trigger a batch of events, taking turns between channels. """
+        self.pending = None
+        active = self.active
+        keys = self.keys
+        served = 0
+        clock = self.clock
+        
+        while active and served < self.batch:
+            lane = active[0]
+            queue = lane.queue
+            
+            if lane.deficit < 1:
+                lane.deficit+= lane.weight
+            
+            while queue and lane.deficit >= 1 and served < self.batch:
+                key, event, args, stamp = queue.popleft()
+                lane.deficit-= 1
+                lane.served+= 1
+                lane.latency.add(clock.seconds() - stamp)
+                self.length-= 1
+                served+= 1
+                
+                if key is not None:
+                    del keys[key]
+                
+                try:
+                    self.trigger(event, *args)
+                except Exception:
+                    self.log('>> Failed to trigger event "{0}"!'.format(event.name), showns=False)
+                    for line in traceback.format_exc().splitlines():
+                        self.log('>> {0}'.format(line), showns=False)
+            
+            if not queue:
+                lane.deficit = 0
+                active.popleft()
+            elif lane.deficit < 1:
+                active.rotate(-1)
+        
+        if active:
+            self.schedule()
+            return
+        
+        if self.shedding:
+            self.shedding = False
+            self.log('>> Inbound queue drained. {0} events dropped so far.'.format(self.dropped), showns=False)
+    
+    def stats(self):
+        """ Return a dict describing the state of the queue. """
+        return {
+            'length': self.length,
+            'limit': self.limit,
+            'peak': self.peak,
+            'queued': self.queued,
+            'coalesced': self.coalesced,
+            'dropped': self.dropped,
+            'channels': len(self.lanes),
+        }
+    
+    def report(self):
+        """ Return a list of lines describing the queue and each channel. """
+        lines = ['{0[length]}/{0[limit]} waiting (peak {0[peak]}), {0[queued]} queued, '
+            '{0[coalesced]} coalesced, {0[dropped]} dropped'.format(self.stats())]
+        
+        for ns, lane in sorted(self.lanes.items()):
+            lines.append('{0} (weight {1}): {2} waiting, {3} dropped, wait {4}'.format(
+                ns or 'global', lane.weight, len(lane.queue), lane.dropped, lane.latency.summary()))
+        
+        return lines
+
+
+# EOF
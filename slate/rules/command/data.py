@@ -3,23 +3,50 @@
 '''
 
 
+import sys
+import copy_reg
 from functools import wraps
 
 from reflex import data
 
 
+def names(cmd):
+    """ Return the names given in a ``cmd`` option, in lower case.
+        
+        The option can be a single name, or a list of names where the first
+        is the command's main name and the rest are aliases.
+    """
+    if isinstance(cmd, basestring):
+        cmd = [cmd]
+    
+    return tuple([name.lower() for name in cmd])
+
+
 class Binding(data.Binding):
-    """Command Binding class."""
+    """ Command Binding class.
+        
+        The names the command can be triggered by are kept in ``names``, in
+        lower case, with the main name first.
+        
+        As well as the reserved options of normal bindings, command bindings
+        can be given a ``limit``. This is the number of times the command can
+        be running at once when it is offloaded. If it is not given, the
+        default from the ``workers`` setting is used.
+    """
+    
+    limit = None
+    running = 0
+    reserved = data.Binding.reserved + ('limit',)
     
     def __init__(self, method, options):
         super(Binding, self).__init__(method, 'command', options)
         
-        cmd = self.options['cmd'] if isinstance(self.options['cmd'], str) else self.options['cmd'][0]
+        self.names = names(self.options['cmd'])
         
-        if ' ' in cmd:
+        if not self.names or [name for name in self.names if not name or ' ' in name]:
             raise ValueError
         
-        self.type = '<event[\'command:{0}\'].binding>'.format(cmd)
+        self.type = '<event[\'command:{0}\'].binding>'.format(self.names[0])
         
         self.group = 'Guests'
         self.level = 25
@@ -57,11 +84,37 @@ def arguments(data=False, start=0, finish=False, separator=' ', sequence=False):
     return data if sequence else separator.join(data)
 
 
-class Command(data.Event):
-    """Command event class."""
+class Command(data.MappedEvent):
+    """ Command event class.
+        
+        Commands are created from the arguments of the ``recv_msg`` packet
+        they came from, with the command's ``trigger``, ``target`` and
+        ``message`` given as an overlay, so the packet's data is neither
+        copied nor changed.
+    """
     
     def init(self, event, data):
         self.arguments = self._args_wrapper()
+    
+    def __getstate__(self):
+        """ Commands are pickled without the ``arguments`` wrapper. """
+        state = self.__dict__.copy()
+        state.pop('arguments', None)
+        return state
+    
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.arguments = self._args_wrapper()
+    
+    def __reduce__(self):
+        """ Commands are pickled as the ``Command`` class currently in
+            this module. The ruleset battery runs this module again when it
+            loads the rulesets, so older copies of the class are still used
+            by modules which imported it before then, and pickle would not
+            be able to find them by name.
+        """
+        cls = sys.modules[__name__].Command
+        return copy_reg._reconstructor, (cls, object, None), self.__getstate__()
         
     def __str__(self):
         return '<event[\'command:'+self.trigger+'\']>'
@@ -3,15 +3,33 @@
 
 import traceback
 
+from twisted.internet import defer
+
 from reflex import base
 
 from slate.rules.command import data
 
 class Ruleset(base.Ruleset):
+    """ Command ruleset.
+        
+        Commands are kept in ``commands``, a dict mapping each name a
+        command can be triggered by, in lower case, to its binding. A
+        command can be given more than one name by binding it with a list
+        of names as the ``cmd`` option. The first name is the command's
+        main name, and the rest are aliases. Binding, unbinding and
+        looking up a command are all single dict operations.
+        
+        The event map holds a dict of the commands by their main names.
+    """
     
     def init(self, core):
         self.users = core.users
-        self.index = {}
+        self.commands = {}
+        self.limit = int(core.config.workers.get('limit', 0))
+    
+    def set_map(self, mapref):
+        super(Ruleset, self).set_map(mapref)
+        self.commands = {}
     
     def bind(self, meth, event, **options):
         """ Creates a command binding.
@@ -20,92 +38,74 @@ class Ruleset(base.Ruleset):
             method. If successful, this method returns the command binding.
             On failure, ``None`` is returned.
         """
-        if not options:
+        if not options or not options.get('cmd'):
             return None
         
-        if not options['cmd']:
-            return None
-        
-        if not 'command' in self.mapref:
-            self.mapref['command'] = []
-        
-        # Check if the command binding already exists.
-        for binding in self.mapref['command']:
-            if (binding.call, binding.options) is (meth, options):
-                return None
-        
         try:
-            cmd = options['cmd'].lower()
-            if ' ' in cmd:
-                raise AttributeError
-        except AttributeError as e:
-            self.debug('>> Command name \'{0}\' is invalid'.format(cmd))
+            binding = data.Binding(meth, options)
+        except (AttributeError, TypeError, ValueError):
+            self.debug('>> Command name \'{0}\' is invalid'.format(options['cmd']))
             return None
         
-        if cmd in self.index:
-            self.debug('>> Command \'{0}\' already exists'.format(cmd))
-            return None
-        
-        binding = data.Binding(meth, options)
-        binding.set_privs(self.users.groups)
-        self.mapref['command'].append(binding)
-        self.index[cmd.lower()] = len(self.mapref['command']) - 1
+        with self.lock:
+            for name in binding.names:
+                if name in self.commands:
+                    self.debug('>> Command \'{0}\' already exists'.format(name))
+                    return None
+            
+            binding.set_privs(self.users.groups)
+            
+            for name in binding.names:
+                self.commands[name] = binding
+            
+            self.mapref.setdefault('command', {})[binding.names[0]] = binding
         
         return binding
-        
     
     def unbind(self, meth, event, **options):
         """ Remove a command binding.
             
-            This method attempts to remove a command binding for the given
-            method. If successful, ``True`` is returned. On failure, ``False``
-            is returned.
+            The command is found by the first name in the ``cmd`` option,
+            which can be any of the command's names, and all of its names
+            are removed. If successful, ``True`` is
+            returned. On failure, ``False`` is returned.
         """
-        if not options:
-            return False
-        
         try:
-            cmd = options['cmd'].lower()
-            if ' ' in cmd:
-                raise AttributeError
-        except AttributeError as e:
-            self.debug('>> Command name \'{0}\' is invalid'.format(cmd))
-            return None
+            name = data.names(options['cmd'])[0]
+        except (AttributeError, IndexError, KeyError, TypeError):
+            return False
         
-        if 'command' in self.mapref.keys():
+        with self.lock:
+            binding = self.commands.get(name)
             
-            if not cmd in self.index.keys():
+            if binding is None or binding.call != meth:
                 return False
             
-            del self.mapref['command'][self.index[cmd]]
-        
-        if len(self.mapref['command']) == 0:
-            del self.mapref['command']
+            for name in binding.names:
+                if self.commands.get(name) is binding:
+                    del self.commands[name]
+            
+            commands = self.mapref.get('command', {})
+            commands.pop(binding.names[0], None)
+            
+            if not commands:
+                self.mapref.pop('command', None)
         
-        self.sort_index()
         return True
     
-    def sort_index(self):
-        temp = self.index
-        self.index = {}
-        for name in temp:
-            for key, binding in enumerate(self.mapref['command']):
-                if name != binding.options['cmd'].lower():
-                    continue
-                self.index[name] = key
-                continue
-    
     def trigger(self, event, dAmn):
         """Trigger a command."""
         try:
-            if not event.trigger.lower() in self.index.keys():
-                self.debug('>> No such command as \'{0}\''.format(event.trigger))
-                return None
+            binding = self.commands.get(event.trigger.lower())
         except AttributeError:
             self.debug('>> Invalid command provided')
             return None
         
-        return self.run(self.mapref['command'][self.index[event.trigger.lower()]], event, dAmn)
+        if binding is None:
+            self.debug('>> No such command as \'{0}\''.format(event.trigger))
+            return None
+        
+        return self.run(binding, event, dAmn)
     
     def run(self, binding, event, dAmn):
         """Attempt to run a command's event binding."""
@@ -116,7 +116,7 @@ class Ruleset(base.Ruleset):
             if not value:
                 continue
             
-            if key == 'cmd' and value.lower() == cmd:
+            if key in ('cmd', 'help'):
                 continue
             
             if key == 'priv':
@@ -126,7 +126,7 @@ class Ruleset(base.Ruleset):
                 continue
             
             if key == 'channel':
-                if dAmn.format_ns(str(option)).lower() == str(event.ns).lower():
+                if dAmn.format_ns(str(value)).lower() == str(event.ns).lower():
                     continue
                 return None
             
@@ -156,17 +156,27 @@ class Ruleset(base.Ruleset):
         
         sub = event.arguments(1)
         if sub == '?':
-            if binding.options and binding.options['help']:
+            if binding.options.get('help'):
                 dAmn.say(event.target, ': '.join([str(event.user), binding.options['help']]))
                 return None
             
-            dAmn.say(data.target, event.user+': There is no information for this command.')
+            dAmn.say(event.target, event.user+': There is no information for this command.')
             return None
         
         self.debug('** Running command \''+event.trigger+'\' for '+str(event.user)+'.')
         
+        limit = self.limit if binding.limit is None else binding.limit
+        
+        if limit and binding.running >= limit:
+            dAmn.say(event.ns, '{0}: Command {1} is busy, try again later.'.format(event.user, cmd))
+            return None
+        
         #try:
-        binding.call(event, dAmn)
+        result = self.call(binding, event, dAmn)
+        
+        if isinstance(result, defer.Deferred):
+            binding.running+= 1
+            result.addBoth(self.finished, binding)
         #except Exception as e:
         #    log = self.debug
         #    log('>> Failed to execute command "{0}"!'.format(event.trigger))
@@ -176,6 +186,11 @@ class Ruleset(base.Ruleset):
         #        log('>> {0}'.format(line))
         return None
     
+    def finished(self, result, binding):
+        """ Called when an offloaded command finishes. """
+        binding.running-= 1
+        return result
+    
     def privd(self, user, level, cmd):
         return self.users.has(user, level)
 
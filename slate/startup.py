@@ -0,0 +1,187 @@
+''' slate.startup
+    Startup profiler.
+    Created by photofroggy.
+    
+    Running ``launch.py --profile-startup`` records how long each module
+    takes to import, how long each ruleset and extension takes to load, and
+    how long it takes to get the reactor running. Imports are no longer
+    timed once the reactor is running, and the report is written to ``storage/startup.txt``, and a summary line is
+    added to ``storage/startup-history.txt`` so that startup times can be
+    compared between builds.
+    
+    This module only uses the standard library, so that it can be set up
+    before anything else is imported.
+'''
+
+import sys
+import time
+import __builtin__
+
+
+profiler = None
+
+
+class StartupProfiler(object):
+    """ Startup profiler.
+        
+        While installed, every call to ``__import__`` is timed. For each
+        module, the total time spent importing it is recorded, along with
+        the time spent in the module itself, not counting the modules it
+        imports in turn.
+        
+        Points in the startup can be recorded with ``mark()``, and are
+        reported with the time since the profiler was created.
+    """
+    
+    top = 30
+    
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.start = clock()
+        self.imports = {}
+        self.stack = []
+        self.names = []
+        self.marks = []
+        self.original = None
+    
+    def install(self):
+        """ Start timing imports. """
+        if self.original is not None:
+            return
+        
+        self.original = __builtin__.__import__
+        __builtin__.__import__ = self.hook
+    
+    def uninstall(self):
+        """ Stop timing imports. """
+        if self.original is None:
+            return
+        
+        __builtin__.__import__ = self.original
+        self.original = None
+    
+    def hook(self, name, globals=None, locals=None, fromlist=None, level=-1):
+        """ Replacement for ``__import__``. """
+        start = self.clock()
+        self.stack.append(0.0)
+        self.names.append(name)
+        
+        try:
+            return self.original(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = self.clock() - start
+            nested = self.stack.pop()
+            self.names.pop()
+            
+            if self.stack:
+                self.stack[-1]+= elapsed
+            
+            entry = self.imports.setdefault(self.resolve(name, globals, level), [0.0, 0.0])
+            entry[1]+= elapsed - nested
+            
+            # Nested imports of the same module are already counted.
+            if not name in self.names:
+                entry[0]+= elapsed
+    
+    def resolve(self, name, globals, level=-1):
+        """ Return the full name of an imported module.
+            
+            Relative imports are given the name of the package they were
+            imported from.
+        """
+        if not globals:
+            return name
+        
+        package = globals.get('__name__') or ''
+        
+        if not '__path__' in globals:
+            package = package.rpartition('.')[0]
+        
+        if level > 0:
+            for step in range(level - 1):
+                package = package.rpartition('.')[0]
+            
+            return package + '.' + name if name else package
+        
+        if name in sys.modules:
+            return name
+        
+        if package and package + '.' + name in sys.modules:
+            return package + '.' + name
+        
+        return name
+    
+    def mark(self, name):
+        """ Record a point in the startup. """
+        self.marks.append((name, self.clock() - self.start))
+    
+    def report(self, batteries=()):
+        """ Return a list of lines describing the startup.
+            
+            ``batteries`` is a list of pairs of a heading and a
+            :py:class:`PackageBattery <reflex.control.PackageBattery>`,
+            used to report how long each ruleset and extension took to load.
+        """
+        lines = ['Milestones:']
+        last = 0.0
+        
+        for name, seconds in self.marks:
+            lines.append('  {0:>9.1f}ms  (+{1:.1f}ms)  {2}'.format(seconds * 1000, (seconds - last) * 1000, name))
+            last = seconds
+        
+        ranked = sorted(self.imports.items(), key=lambda item: item[1][1], reverse=True)
+        own = sum([entry[1] for entry in self.imports.values()])
+        lines.append('')
+        lines.append('Imports: {0} modules, {1:.1f}ms. Slowest {2}, by own time:'.format(
+            len(self.imports), own * 1000, min(self.top, len(ranked))))
+        
+        for name, (total, spent) in ranked[:self.top]:
+            lines.append('  {0:>9.1f}ms  {1:>9.1f}ms total  {2}'.format(spent * 1000, total * 1000, name))
+        
+        for heading, battery in batteries:
+            lines.append('')
+            lines.append('{0}s (import and init):'.format(heading))
+            
+            for name, seconds in sorted(battery.timings.items(), key=lambda item: item[1], reverse=True):
+                lines.append('  {0:>9.1f}ms  {1:>9.1f}ms init  {2}'.format(
+                    seconds * 1000, battery.inits.get(name, 0) * 1000, name))
+            
+            for name in sorted(getattr(battery, 'sleeping', {}).keys()):
+                lines.append('  {0:>11}  {1:>15}  {2}'.format('-', 'on demand', name))
+        
+        return lines
+    
+    def summary(self, build=''):
+        """ Return a single line summary of the startup. """
+        own = sum([entry[1] for entry in self.imports.values()])
+        marks = ', '.join(['{0} {1:.1f}ms'.format(name, seconds * 1000) for name, seconds in self.marks])
+        return '{0} {1}: imports {2:.1f}ms; {3}'.format(
+            time.strftime('%Y-%m-%d %H:%M:%S'), build, own * 1000, marks)
+    
+    def write(self, folder='./storage', build='', batteries=()):
+        """ Write the report and add a line to the history file. """
+        with open(folder + '/startup.txt', 'w') as file:
+            file.write('\n'.join(self.report(batteries)) + '\n')
+        
+        with open(folder + '/startup-history.txt', 'a') as file:
+            file.write(self.summary(build) + '\n')
+
+
+def enable():
+    """ Create the startup profiler, and start timing imports. """
+    global profiler
+    
+    if profiler is None:
+        profiler = StartupProfiler()
+        profiler.install()
+    
+    return profiler
+
+
+def mark(name):
+    """ Record a point in the startup, if the profiler is enabled. """
+    if profiler is not None:
+        profiler.mark(name)
+
+
+# EOF
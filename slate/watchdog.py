@@ -0,0 +1,210 @@
+''' slate.watchdog
+    Reactor stall watchdog.
+    Created by photofroggy.
+    
+    When something blocks the reactor, the only symptom is usually a ping
+    timeout. The watchdog here notices when the reactor stops responding,
+    and logs what it was doing at the time.
+'''
+
+import sys
+import time
+import thread
+import threading
+import traceback
+from collections import deque
+from twisted.internet import reactor
+
+from reflex.stats import Histogram
+
+
+class Stall(object):
+    """ A period where the reactor did not respond.
+        
+        * *float* **start** - The time of the last heartbeat before the stall.
+        * *float* **duration** - How long the stall lasted. This is ``None``
+          until the reactor responds again.
+        * *list* **stack** - The reactor thread's stack when the stall was
+          noticed, as formatted lines.
+        * *str* **extension** - The extension module that was running, if
+          any.
+        * *str* **binding** - The event binding that was running, if any.
+    """
+    
+    def __init__(self, start, stack, extension, binding):
+        self.start = start
+        self.duration = None
+        self.stack = stack
+        self.extension = extension
+        self.binding = binding
+    
+    def source(self):
+        """ Return a short description of what caused the stall. """
+        if self.binding is not None:
+            return '{0} ({1})'.format(self.binding, self.extension or 'unknown extension')
+        
+        return self.extension or 'unknown'
+
+
+class Watchdog(object):
+    """ Reactor stall watchdog.
+        
+        A heartbeat is scheduled on the reactor every ``interval`` seconds,
+        and the delay of each heartbeat is recorded in ``latency``. A
+        separate thread checks the time of the last heartbeat. If the
+        reactor has not responded for ``threshold`` seconds, the stack of
+        the reactor thread is sampled with ``sys._current_frames`` and the
+        stall is logged, along with the extension and binding that were
+        running. The duration of the stall is logged when the reactor
+        responds again.
+        
+        The last ``keep`` stalls are kept in ``stalls``, and totals for each
+        source are kept in ``sources``.
+        
+        Input parameters:
+        
+        * *callable* **stdout** - Method used to log stalls. This is called
+          from the watchdog thread as well as the reactor thread.
+        * *float* **interval** - Seconds between heartbeats.
+        * *float* **threshold** - Seconds without a heartbeat before a stall
+          is reported.
+    """
+    
+    keep = 50
+    
+    def __init__(self, stdout=None, interval=0.5, threshold=2.0, clock=None):
+        self.log = stdout or (lambda m, **kwargs: None)
+        self.interval = interval
+        self.threshold = threshold
+        self.clock = clock or reactor
+        self.lock = threading.Lock()
+        self.ident = None
+        self.last = None
+        self.pending = None
+        self.thread = None
+        self.running = False
+        self.stall = None
+        self.stalls = deque(maxlen=self.keep)
+        self.sources = {}
+        self.latency = Histogram()
+    
+    def start(self):
+        """ Start the heartbeat and the watchdog thread. """
+        if self.running:
+            return
+        
+        self.running = True
+        self.pending = self.clock.callLater(0, self.beat)
+        self.thread = threading.Thread(target=self.watch, name='slate-watchdog')
+        self.thread.daemon = True
+        self.thread.start()
+    
+    def stop(self):
+        """ Stop watching the reactor. """
+        self.running = False
+        
+        if self.pending is not None and self.pending.active():
+            self.pending.cancel()
+        
+        self.pending = None
+    
+    def beat(self):
+        """ Heartbeat. Called in the reactor thread. """
+        now = time.time()
+        
+        if self.ident is None:
+            self.ident = thread.get_ident()
+        
+        with self.lock:
+            last, self.last = self.last, now
+            stall, self.stall = self.stall, None
+        
+        if last is not None:
+            self.latency.add(max(now - last - self.interval, 0))
+        
+        if stall is not None:
+            self.recovered(stall, now - last)
+        
+        if self.running:
+            self.pending = self.clock.callLater(self.interval, self.beat)
+    
+    def watch(self):
+        """ Main loop for the watchdog thread. """
+        while self.running:
+            time.sleep(min(self.interval, self.threshold) / 2)
+            
+            with self.lock:
+                if self.last is None or self.stall is not None:
+                    continue
+                
+                if time.time() - self.last < self.threshold:
+                    continue
+                
+                stall = self.stall = self.sample(self.last)
+            
+            self.stalled(stall)
+    
+    def sample(self, start):
+        """ Sample the reactor thread's stack. """
+        frame = sys._current_frames().get(self.ident)
+        
+        if frame is None:
+            return Stall(start, [], None, None)
+        
+        stack = traceback.format_stack(frame)
+        extension = None
+        binding = None
+        
+        while frame is not None:
+            module = frame.f_globals.get('__name__', '')
+            
+            if extension is None and module.startswith('extensions.'):
+                extension = module
+            
+            if binding is None and module == 'reflex.base' and 'binding' in frame.f_locals:
+                binding = str(frame.f_locals['binding'].type)
+            
+            frame = frame.f_back
+        
+        return Stall(start, stack, extension, binding)
+    
+    def stalled(self, stall):
+        """ Log a stall as it happens. Called in the watchdog thread. """
+        self.log('>> Reactor has not responded for {0:.1f}s, in {1}.'.format(
+            time.time() - stall.start, stall.source()), showns=False)
+        self.log('>> Reactor stack:', showns=False)
+        
+        for chunk in stall.stack:
+            for line in chunk.rstrip().splitlines():
+                self.log('>> {0}'.format(line), showns=False)
+    
+    def recovered(self, stall, duration):
+        """ Record the end of a stall. Called in the reactor thread. """
+        stall.duration = duration
+        self.stalls.append(stall)
+        
+        total = self.sources.setdefault(stall.source(), [0, 0.0, 0.0])
+        total[0]+= 1
+        total[1]+= duration
+        total[2] = max(total[2], duration)
+        
+        self.log('>> Reactor stalled for {0:.2f}s, in {1}.'.format(duration, stall.source()), showns=False)
+    
+    def report(self):
+        """ Return a list of lines describing the stalls seen so far. """
+        lines = ['Heartbeat delay: {0}'.format(self.latency.summary())]
+        
+        if not self.sources:
+            lines.append('No stalls over {0}s.'.format(self.threshold))
+            return lines
+        
+        ranked = sorted(self.sources.items(), key=lambda item: item[1][1], reverse=True)
+        
+        for source, (count, total, longest) in ranked:
+            lines.append('{0}: {1} stalls, {2:.2f}s total, {3:.2f}s longest'.format(
+                source, count, total, longest))
+        
+        return lines
+
+
+# EOF
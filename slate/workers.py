@@ -0,0 +1,522 @@
+''' slate.workers
+    Worker pools for offloaded event handlers.
+    Created by photofroggy.
+    
+    Event handlers bound with ``offload='thread'`` are run by the thread
+    pool here, so that handlers which block (on disk, sockets, or long
+    computations which release the GIL) do not hold up the reactor.
+    
+    Handlers bound with ``offload='process'`` are run by the process pool,
+    so that CPU-heavy handlers do not compete with the reactor for the GIL.
+'''
+
+import os
+import imp
+import sys
+import time
+import cPickle
+import threading
+import traceback
+import multiprocessing
+from Queue import Queue
+from Queue import Full
+from Queue import Empty
+
+from twisted.internet import defer
+from twisted.internet import reactor
+
+
+class WorkerPool(object):
+    """ Base class for worker pools.
+        
+        Keeps the counters shared by the different pools, and provides the
+        methods used to report rejected and failed jobs.
+        
+        Input parameters:
+        
+        * *int* **size** - The maximum number of workers.
+        * *int* **queue** - The maximum number of jobs waiting for a worker.
+        * *callable* **stdout** - Method used to log rejected and failed jobs.
+    """
+    
+    def __init__(self, size=4, queue=64, stdout=None):
+        self.size = int(size)
+        self.limit = int(queue)
+        self.log = stdout or (lambda m: None)
+        self.running = True
+        
+        self.busy = 0
+        self.peak = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.saturated = 0
+    
+    def submit(self, binding, data, args):
+        """ Run an event binding in a worker. Returns a Deferred. """
+        raise NotImplementedError
+    
+    def queued(self):
+        """ Return the number of jobs waiting for a worker. """
+        return 0
+    
+    def reject(self, binding, d):
+        """ Reject a job. """
+        self.rejected+= 1
+        self.log('>> Worker queue full, dropped "{0}" handler {1}.'.format(
+            binding.event, getattr(binding.call, '__name__', binding.call)))
+        d.callback(None)
+    
+    def failure(self, binding, tb, d):
+        """ Log a handler failure. Called in the reactor thread. """
+        self.log('>> Offloaded "{0}" handler {1} failed!'.format(
+            binding.event, getattr(binding.call, '__name__', binding.call)))
+        self.log('>> Error:')
+        for line in tb.splitlines():
+            self.log('>> {0}'.format(line))
+        d.callback(None)
+    
+    def stats(self):
+        """ Return a dict describing the state of the pool. """
+        return {
+            'size': self.size,
+            'busy': self.busy,
+            'queued': self.queued(),
+            'limit': self.limit,
+            'peak': self.peak,
+            'submitted': self.submitted,
+            'completed': self.completed,
+            'failed': self.failed,
+            'rejected': self.rejected,
+            'saturated': self.saturated,
+        }
+    
+    def stop(self):
+        """ Stop the workers. """
+        self.running = False
+
+
+class ThreadPool(WorkerPool):
+    """ A bounded pool of worker threads.
+        
+        Jobs are put on a queue which holds at most ``queue`` jobs, and are
+        taken off by up to ``size`` daemon threads. Threads are only started
+        when there is work for them. If the queue is full when a job is
+        submitted, the job is rejected and a message is logged, rather than
+        letting a backlog grow without limit.
+        
+        Handlers run in worker threads are given the real client, but most
+        of it belongs to the reactor thread. The client's ``send`` method is
+        safe to call from any thread, and so are the helpers which only
+        build a packet and pass it to ``send``, like ``say``, ``action``,
+        ``npmsg``, ``join`` and ``part``. Give these a namespace which is
+        already formatted, like the event's ``ns`` or a command's
+        ``target``.
+        
+        Threaded handlers must not call anything else on the client. In
+        particular, ``format_ns`` and ``deform_ns`` write to a cache, the
+        logger and the ``channel`` data are changed by the reactor thread,
+        and the reactor itself is not thread-safe. Use
+        ``reactor.callFromThread`` to run such code in the reactor thread.
+        
+        Input parameters:
+        
+        * *int* **size** - The maximum number of worker threads.
+        * *int* **queue** - The maximum number of jobs waiting for a thread.
+        * *callable* **stdout** - Method used to log rejected and failed jobs.
+    """
+    
+    def __init__(self, size=4, queue=64, stdout=None):
+        super(ThreadPool, self).__init__(size, queue, stdout)
+        self.queue = Queue(self.limit)
+        self.threads = []
+        self.lock = threading.Lock()
+    
+    def submit(self, binding, data, args):
+        """ Run an event binding in a worker thread.
+            
+            Returns a Deferred which fires with the result of the handler, in
+            the reactor thread. If the handler fails or the job is rejected,
+            the Deferred fires with ``None``.
+        """
+        d = defer.Deferred()
+        
+        if not self.running:
+            self.reject(binding, d)
+            return d
+        
+        if self.busy + self.queue.qsize() >= len(self.threads):
+            if len(self.threads) < self.size:
+                self.spawn()
+            else:
+                self.saturated+= 1
+        
+        try:
+            self.queue.put_nowait((binding, data, args, d))
+        except Full:
+            self.reject(binding, d)
+            return d
+        
+        self.submitted+= 1
+        self.peak = max(self.peak, self.queue.qsize())
+        
+        return d
+    
+    def queued(self):
+        return self.queue.qsize()
+    
+    def spawn(self):
+        """ Start a new worker thread. """
+        thread = threading.Thread(target=self.work, name='slate-worker-{0}'.format(len(self.threads)))
+        thread.daemon = True
+        self.threads.append(thread)
+        thread.start()
+    
+    def work(self):
+        """ Main loop for worker threads. """
+        while True:
+            job = self.queue.get()
+            
+            if job is None:
+                return
+            
+            binding, data, args, d = job
+            
+            with self.lock:
+                self.busy+= 1
+            
+            try:
+                result = binding.call(data, *args)
+            except Exception:
+                with self.lock:
+                    self.failed+= 1
+                reactor.callFromThread(self.failure, binding, traceback.format_exc(), d)
+            else:
+                reactor.callFromThread(d.callback, result)
+            finally:
+                with self.lock:
+                    self.busy-= 1
+                    self.completed+= 1
+    
+    def stats(self):
+        stats = super(ThreadPool, self).stats()
+        stats['threads'] = len(self.threads)
+        return stats
+    
+    def stop(self):
+        """ Stop the worker threads.
+            
+            Jobs that have not been started are dropped. Jobs which are
+            running are left to finish, but the threads are daemons, so they
+            will not keep the process alive.
+        """
+        self.running = False
+        
+        while True:
+            try:
+                job = self.queue.get_nowait()
+            except Empty:
+                break
+            
+            if job is not None:
+                job[3].callback(None)
+        
+        for thread in self.threads:
+            try:
+                self.queue.put_nowait(None)
+            except Full:
+                break
+        
+        self.threads = []
+
+
+class Replies(object):
+    """ Stand-in for the client in worker processes.
+        
+        Handlers run in a worker process are given one of these instead of
+        the client. Any method called on it is recorded, and the calls are
+        made on the real client in the main process once the handler has
+        finished. This means handlers can call methods like ``say`` and
+        ``action``, but can not use anything they return.
+    """
+    
+    def __init__(self):
+        self.calls = []
+    
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        
+        def record(*args, **kwargs):
+            self.calls.append((name, args, kwargs))
+        
+        return record
+
+
+# When each module was last loaded in a worker process, by name. Modules
+# loaded before the worker was started are not listed, and go by ``started``.
+loaded = {}
+started = None
+
+
+def prepare():
+    """ Set up a worker process. Called by each worker when it starts. """
+    global started
+    started = time.time()
+    loaded.clear()
+
+
+def current(name):
+    """ Return a module in a worker process.
+        
+        The module is imported if it has not been imported yet, and
+        reloaded if its source has changed since it was loaded. Workers are
+        forked once, so this is how they pick up extensions which have been
+        reloaded since.
+    """
+    module = sys.modules.get(name)
+    
+    if module is None:
+        __import__(name)
+        loaded[name] = time.time()
+        return sys.modules[name]
+    
+    since = loaded.get(name, started)
+    path = getattr(module, '__file__', None) or ''
+    
+    if since is None:
+        return module
+    
+    if path[-4:] in ('.pyc', '.pyo'):
+        path = path[:-1]
+    
+    try:
+        changed = os.path.getmtime(path) > since
+    except OSError:
+        changed = False
+    
+    if changed:
+        imp.reload(module)
+        loaded[name] = time.time()
+    
+    return module
+
+
+def run_handler(module, name, method, data):
+    """ Run an event handler in a worker process.
+        
+        The handler is found by name, as functions and methods can not be
+        sent to other processes. If ``method`` is ``None``, the handler is
+        the function ``name`` in ``module``. Otherwise, it is the method
+        ``method`` of the class ``name`` in ``module``, called on an
+        instance of the class which has not been initialised. Returns the
+        calls made on the client, and the traceback if the handler failed.
+    """
+    replies = Replies()
+    
+    try:
+        call = getattr(current(module), name)
+        
+        if method is not None:
+            call = getattr(call.__new__(call), method)
+        
+        call(data, replies)
+    except Exception:
+        return replies.calls, traceback.format_exc()
+    
+    return replies.calls, None
+
+
+def target(call):
+    """ Return the ``(module, name, method)`` a worker process can find a
+        handler by, or ``None`` if it can not be run in a worker process.
+        
+        Functions which can be found by name in their module, and methods
+        of classes which can be found by name in their module, can be used.
+        Lambdas and nested functions can not.
+    """
+    owner = getattr(call, 'im_self', None)
+    
+    if owner is not None:
+        cls = owner.__class__
+        module = sys.modules.get(cls.__module__)
+        method = getattr(call, '__name__', None)
+        
+        if module is None or getattr(module, cls.__name__, None) is not cls or method is None:
+            return None
+        
+        if getattr(cls, method, None) is None:
+            return None
+        
+        return cls.__module__, cls.__name__, method
+    
+    module = sys.modules.get(getattr(call, '__module__', None))
+    
+    if module is None or getattr(module, getattr(call, '__name__', ''), None) is not call:
+        return None
+    
+    return call.__module__, call.__name__, None
+
+
+def portable(call):
+    """ Determine whether a handler can be run in a worker process. """
+    return target(call) is not None
+
+
+class Job(object):
+    """ A job given to the process pool. """
+    
+    def __init__(self, binding, client, d):
+        self.binding = binding
+        self.client = client
+        self.d = d
+        self.timer = None
+
+
+class ProcessPool(WorkerPool):
+    """ A bounded pool of worker processes.
+        
+        Handlers are run in a ``multiprocessing`` pool, which is started
+        once by ``start``. This should be called before the reactor is
+        running, so the workers are not forked with the reactor's sockets
+        and threads. Until then, offloaded handlers are called directly.
+        The handler is given a
+        pickled copy of the event, and a
+        :py:class:`Replies <slate.workers.Replies>` object in place of the
+        client. When the handler finishes, the calls it made are repeated on
+        the client in the reactor thread.
+        
+        Handlers must be module-level functions or methods of reactors,
+        which take the event and the client, and events must be picklable.
+        Handlers which can not be run in a worker process are called
+        directly, and a message is logged.
+        
+        Reactors can not be sent to the workers. A reactor's handler is
+        called on an instance of the reactor's class which has not been
+        initialised, so it can use the event, the client stand-in, and the
+        methods and class attributes of the reactor, but not the attributes
+        set up by ``init``. Workers reload a module when its source has
+        changed, so reloaded extensions are used without restarting them.
+        
+        No more than ``queue`` jobs can be waiting or running at once. If a
+        job has not finished after ``timeout`` seconds, which can happen if
+        a worker process dies, it is given up on and logged as failed.
+    """
+    
+    def __init__(self, size=2, queue=64, stdout=None, timeout=300):
+        super(ProcessPool, self).__init__(size, queue, stdout)
+        self.pool = None
+        self.pending = 0
+        self.timeout = timeout
+        self.jobs = set()
+    
+    def submit(self, binding, data, args):
+        """ Run an event binding in a worker process.
+            
+            Returns a Deferred which fires with ``None`` once the handler's
+            replies have been sent.
+        """
+        call = binding.call
+        path = target(call)
+        
+        try:
+            if self.pool is None and self.running:
+                raise RuntimeError('the process pool has not been started')
+            if path is None:
+                raise TypeError('handler is not a module-level function or a reactor method')
+            cPickle.dumps(data, cPickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            self.log('>> Can not run "{0}" handler {1} in a worker process: {2}'.format(
+                binding.event, getattr(call, '__name__', call), e))
+            return call(data, *args)
+        
+        d = defer.Deferred()
+        
+        if not self.running or self.pending >= self.limit:
+            self.reject(binding, d)
+            return d
+        
+        if self.pending >= self.size:
+            self.saturated+= 1
+        
+        job = Job(binding, args[0] if args else None, d)
+        
+        def callback(result):
+            reactor.callFromThread(self.finished, job, result)
+        
+        self.pool.apply_async(run_handler, path + (data,), callback=callback)
+        job.timer = reactor.callLater(self.timeout, self.expired, job)
+        self.jobs.add(job)
+        self.pending+= 1
+        self.submitted+= 1
+        self.peak = max(self.peak, self.pending)
+        self.busy = min(self.pending, self.size)
+        
+        return d
+    
+    def start(self):
+        """ Start the worker processes. """
+        if self.pool is None and self.running:
+            self.pool = multiprocessing.Pool(self.size, prepare)
+    
+    def queued(self):
+        return max(self.pending - self.size, 0)
+    
+    def done(self, job):
+        """ Stop tracking a job. Returns ``False`` if it was already done. """
+        if not job in self.jobs:
+            return False
+        
+        self.jobs.remove(job)
+        self.pending-= 1
+        self.busy = min(self.pending, self.size)
+        
+        if job.timer.active():
+            job.timer.cancel()
+        
+        return True
+    
+    def finished(self, job, result):
+        """ Send the replies from a finished job. Called in the reactor thread. """
+        if not self.done(job):
+            return
+        
+        calls, tb = result
+        
+        if job.client is not None:
+            for name, args, kwargs in calls:
+                getattr(job.client, name)(*args, **kwargs)
+        
+        if tb is not None:
+            self.failed+= 1
+            self.failure(job.binding, tb, job.d)
+            return
+        
+        self.completed+= 1
+        job.d.callback(None)
+    
+    def expired(self, job):
+        """ Give up on a job which has taken too long. """
+        if not self.done(job):
+            return
+        
+        self.failed+= 1
+        self.failure(job.binding, 'Worker did not finish the job within {0} seconds.'.format(self.timeout), job.d)
+    
+    def stop(self):
+        """ Stop the worker processes. Running jobs are abandoned. """
+        self.running = False
+        
+        for job in list(self.jobs):
+            self.done(job)
+            job.d.callback(None)
+        
+        if self.pool is None:
+            return
+        
+        self.pool.terminate()
+        self.pool = None
+
+
+# EOF
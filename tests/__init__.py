@@ -0,0 +1,7 @@
+''' Tests for Slate.
+    
+    Run with ``python -m unittest discover -t . -s tests`` from the root of the
+    repository.
+'''
+
+# EOF
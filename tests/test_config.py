@@ -0,0 +1,91 @@
+''' tests.test_config
+    Tests for saving and loading settings.
+'''
+
+import os
+import shutil
+import tempfile
+import unittest
+from twisted.internet.task import Clock
+
+from reflex.data import Event
+from slate.config import Settings
+from slate.inbound import EventQueue
+from slate.workers import ThreadPool
+from slate.workers import ProcessPool
+
+
+class TestRoundTrip(unittest.TestCase):
+    
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.file = os.path.join(self.folder, 'config.bsv')
+    
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+    
+    def reload(self, settings):
+        settings.save()
+        return Settings(self.file)
+    
+    def test_thread_pool(self):
+        settings = Settings(self.file)
+        settings.workers['threads'] = 2
+        settings.workers['queue'] = 3
+        settings = self.reload(settings)
+        
+        self.assertEqual((settings.workers['threads'], settings.workers['queue']), (2, 3))
+        
+        pool = ThreadPool(settings.workers['threads'], settings.workers['queue'])
+        self.assertEqual((pool.size, pool.queue.maxsize), (2, 3))
+        pool.stop()
+    
+    def test_process_pool(self):
+        settings = Settings(self.file)
+        settings.workers['processes'] = 3
+        settings.workers['limit'] = 1
+        settings = self.reload(settings)
+        
+        self.assertEqual((settings.workers['processes'], settings.workers['limit']), (3, 1))
+        self.assertEqual(ProcessPool(settings.workers['processes']).size, 3)
+    
+    def test_inbound_limits(self):
+        settings = Settings(self.file)
+        settings.inbound['limit'] = 3
+        settings.inbound['batch'] = 2
+        settings = self.reload(settings)
+        
+        self.assertEqual((settings.inbound['limit'], settings.inbound['batch']), (3, 2))
+        
+        inbound = EventQueue(lambda event: None, settings.inbound['limit'],
+            settings.inbound['batch'], clock=Clock())
+        
+        for i in range(5):
+            inbound.put(Event('recv_msg', [('ns', '#botdom')]))
+        
+        self.assertEqual((len(inbound), inbound.dropped), (3, 2))
+    
+    def test_weights(self):
+        settings = Settings(self.file)
+        settings.inbound['weights']['#botdom'] = 2.5
+        settings = self.reload(settings)
+        
+        self.assertEqual(settings.inbound['weights'], {'#botdom': 2.5})
+        
+        seen = []
+        clock = Clock()
+        inbound = EventQueue(lambda event: seen.append(event.ns),
+            weights=settings.inbound['weights'], clock=clock)
+        
+        for ns in ['#botdom'] * 3 + ['#help'] * 3:
+            event = Event('recv_msg', [('ns', ns)])
+            inbound.put(event)
+        
+        clock.advance(0)
+        self.assertEqual(seen, ['#botdom', '#botdom', '#help', '#botdom', '#help', '#help'])
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+# EOF
@@ -0,0 +1,77 @@
+''' tests.test_inbound
+    Tests for the inbound event queue.
+'''
+
+import unittest
+from twisted.internet.task import Clock
+
+from reflex.control import EventManager
+from dAmnViper.parse import Packet
+from slate.custom import Client
+from slate.inbound import EventQueue
+
+
+def message(channel, user, text):
+    """ Return a raw ``recv msg`` packet for a channel. """
+    return 'recv chat:{0}\n\nmsg main\nfrom={1}\n\n{2}'.format(channel, user, text)
+
+
+class TestLanes(unittest.TestCase):
+    
+    def setUp(self):
+        self.seen = []
+        self.clock = Clock()
+        self.events = EventManager()
+        self.events.bind(self.handler, 'recv_msg')
+        self.client = Client(
+            stdout=lambda *args, **kwargs: None,
+            stddebug=lambda *args, **kwargs: None,
+            _events=self.events,
+            _teardown=lambda: None,
+        )
+        self.client.inbound = EventQueue(
+            self.events.trigger,
+            batch=4,
+            clock=self.clock,
+            weights={'#Botdom': 3},
+            namespace=self.client.deform_ns
+        )
+    
+    def handler(self, event, dAmn):
+        self.seen.append(event.ns)
+    
+    def feed(self, channel, count):
+        for i in range(count):
+            self.client.handle_pkt(Packet(message(channel, 'someone', 'hello')), 0)
+    
+    def test_packets_share_weighted_lane(self):
+        self.feed('Botdom', 6)
+        self.feed('DSGateway', 6)
+        
+        inbound = self.client.inbound
+        self.assertEqual(sorted(inbound.lanes), ['#botdom', '#dsgateway'])
+        self.assertEqual(inbound.lanes['#botdom'].weight, 3)
+        self.assertEqual(inbound.lanes['#dsgateway'].weight, 1)
+        
+        # Each batch of 4 gives #botdom three turns for every one of
+        # #dsgateway, until #botdom runs dry.
+        self.clock.advance(0)
+        self.assertEqual(self.seen, ['chat:Botdom'] * 3 + ['chat:DSGateway'] +
+            ['chat:Botdom'] * 3 + ['chat:DSGateway'] * 5)
+    
+    def test_weigh_uses_same_key(self):
+        inbound = self.client.inbound
+        inbound.weigh('chat:dsgateway', 2)
+        inbound.weigh('#Help', 5)
+        self.feed('DSGateway', 1)
+        self.feed('help', 1)
+        
+        self.assertEqual(inbound.lanes['#dsgateway'].weight, 2)
+        self.assertEqual(inbound.lanes['#help'].weight, 5)
+        self.assertEqual(len(inbound.lanes), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+# EOF
@@ -0,0 +1,93 @@
+''' tests.test_lazy
+    Tests for loading reactors on demand.
+'''
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+from reflex.base import Ruleset
+from reflex.data import Event
+from reflex.control import EventManager
+from reflex.control import ReactorBattery
+
+
+MODULE = """
+from reflex.base import Reactor as Base
+
+manifest = [
+    ('ping', {'user': 'someone'}),
+]
+
+
+class Reactor(Base):
+    
+    name = 'pinger'
+    
+    def init(self, seen):
+        self.seen = seen
+        self.bind(self.ping, 'ping', user='someone')
+    
+    def ping(self, event, *args):
+        self.seen.append(event.user)
+"""
+
+
+class Counting(Ruleset):
+    """ Ruleset which records the bindings it runs. """
+    
+    ran = []
+    
+    def run(self, binding, data, *args):
+        Counting.ran.append(binding.source)
+        return super(Counting, self).run(binding, data, *args)
+
+
+class TestOnDemand(unittest.TestCase):
+    
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.folder, 'lazypkg'))
+        open(os.path.join(self.folder, 'lazypkg', '__init__.py'), 'w').close()
+        
+        with open(os.path.join(self.folder, 'lazypkg', 'pinger.py'), 'w') as file:
+            file.write(MODULE)
+        
+        sys.path.insert(0, self.folder)
+        import lazypkg
+        
+        Counting.ran = []
+        self.seen = []
+        self.events = EventManager()
+        self.events.define_rules('ping', Counting)
+        self.battery = ReactorBattery(lazy=True)
+        self.battery.load_objects(self.events, lazypkg, 'Reactor', self.seen)
+    
+    def tearDown(self):
+        sys.path.remove(self.folder)
+        
+        for name in ('lazypkg', 'lazypkg.pinger'):
+            sys.modules.pop(name, None)
+        
+        shutil.rmtree(self.folder)
+    
+    def test_first_event_runs_through_ruleset(self):
+        self.assertEqual(self.battery.sleeping.keys(), ['lazypkg.pinger'])
+        
+        self.events.trigger(Event('ping', [('user', 'someone')]))
+        
+        self.assertEqual(self.seen, ['someone'])
+        self.assertEqual(Counting.ran, [None, 'pinger'])
+        self.assertEqual(self.battery.sleeping, {})
+        
+        self.events.trigger(Event('ping', [('user', 'someone')]))
+        self.assertEqual(self.seen, ['someone', 'someone'])
+        self.assertEqual(Counting.ran, [None, 'pinger', 'pinger'])
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+# EOF
@@ -0,0 +1,105 @@
+''' tests.test_reload
+    Tests for reloading extensions.
+'''
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from twisted.internet.task import Clock
+
+from reflex.control import EventManager
+from reflex.control import ReactorBattery
+from dAmnViper.tasks import Scheduler
+
+
+MODULE = """
+from slate.extension import ExtensionBase
+
+
+class Extension(ExtensionBase):
+    
+    version = {0!r}
+    
+    def init(self, core):
+        {1}
+        self.call_every(10, core.ticks.append, self.version)
+"""
+
+
+class Core(object):
+    """ The parts of the bot an extension needs. """
+    
+    def __init__(self):
+        self.log = None
+        self.ticks = []
+        self.clock = Clock()
+        self.client = self
+        self.scheduler = Scheduler(self.clock)
+        self.scheduler.start()
+
+
+class TestReload(unittest.TestCase):
+    
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, 'reloadpkg')
+        self.mtime = 1000000000
+        os.mkdir(self.path)
+        open(os.path.join(self.path, '__init__.py'), 'w').close()
+        self.write('old')
+        
+        sys.path.insert(0, self.folder)
+        import reloadpkg
+        self.package = reloadpkg
+        
+        self.core = Core()
+        self.events = EventManager()
+        self.battery = ReactorBattery()
+        self.load()
+    
+    def tearDown(self):
+        sys.path.remove(self.folder)
+        
+        for name in ('reloadpkg', 'reloadpkg.ticker'):
+            sys.modules.pop(name, None)
+        
+        shutil.rmtree(self.folder)
+    
+    def write(self, version, init='pass'):
+        """ Write a new version of the extension's module. """
+        path = os.path.join(self.path, 'ticker.py')
+        
+        with open(path, 'w') as file:
+            file.write(MODULE.format(version, init))
+        
+        # Make sure the change is seen, even within the same second.
+        self.mtime+= 10
+        os.utime(path, (self.mtime, self.mtime))
+    
+    def load(self):
+        self.battery.load_objects(self.events, self.package, 'Extension', self.core)
+    
+    def test_failed_reload_keeps_tasks(self):
+        self.write('broken', "raise RuntimeError('broken')")
+        self.battery.log = lambda *args, **kwargs: None
+        self.load()
+        
+        self.assertEqual(self.battery.objects['reloadpkg.ticker'].version, 'old')
+        self.core.clock.advance(10)
+        self.assertEqual(self.core.ticks, ['old'])
+    
+    def test_reload_replaces_tasks(self):
+        self.write('new')
+        self.load()
+        
+        self.assertEqual(self.battery.objects['reloadpkg.ticker'].version, 'new')
+        self.core.clock.advance(10)
+        self.assertEqual(self.core.ticks, ['new'])
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+# EOF
@@ -0,0 +1,70 @@
+''' tests.test_stats
+    Tests for the event handler profile.
+'''
+
+import gc
+import weakref
+import unittest
+
+from reflex.data import Event
+from reflex.stats import Profile
+from reflex.control import EventManager
+
+
+class Handler(object):
+    """ Stands in for a reactor. """
+    
+    def handle(self, event, *args):
+        pass
+
+
+class TestProfile(unittest.TestCase):
+    
+    def setUp(self):
+        self.events = EventManager()
+        self.profile = Profile()
+        self.events.profile(self.profile)
+    
+    def bind(self):
+        handler = Handler()
+        binding = self.events.bind(handler.handle, 'recv_msg')
+        binding.source = 'handler'
+        return handler, binding
+    
+    def test_unbound_bindings_are_released(self):
+        handler, binding = self.bind()
+        self.events.trigger(Event('recv_msg'))
+        self.events.unbind(handler.handle, 'recv_msg')
+        
+        ref = weakref.ref(handler)
+        del handler, binding
+        gc.collect()
+        
+        self.assertTrue(ref() is None)
+        self.assertTrue('  handler handle <event[\'recv_msg\'].binding>: 1 calls' in '\n'.join(self.profile.report()))
+    
+    def test_counters_carry_on_after_rebinding(self):
+        handler, binding = self.bind()
+        self.events.trigger(Event('recv_msg'))
+        self.events.unbind(handler.handle, 'recv_msg')
+        handler, binding = self.bind()
+        self.events.trigger(Event('recv_msg'))
+        
+        self.assertEqual(len(self.profile.stats), 1)
+        self.assertEqual(self.profile.stats.values()[0].calls.count, 2)
+    
+    def test_reset(self):
+        handler, binding = self.bind()
+        self.events.trigger(Event('recv_msg'))
+        self.profile.reset()
+        self.assertEqual(self.profile.stats, {})
+        
+        self.events.trigger(Event('recv_msg'))
+        self.assertEqual(self.profile.stats.values()[0].calls.count, 1)
+        self.assertTrue(binding.stats is self.profile.stats.values()[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+# EOF
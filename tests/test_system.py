@@ -0,0 +1,154 @@
+''' tests.test_system
+    Tests for the commands in the system extension.
+    
+    Commands are sent to a bot as ``recv_msg`` packets, and go through the
+    client's ``pkt_recv_msg`` and the command ruleset like they do when the
+    bot is connected.
+'''
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import __builtin__
+from twisted.internet.task import Clock
+
+# The bot finds rulesets and extensions through the paths of their
+# packages, and these tests change directory, so relative paths from
+# running the tests in the repository have to be made absolute.
+sys.path[:] = [os.path.abspath(path) for path in sys.path]
+
+for module in sys.modules.values():
+    if getattr(module, '__path__', None):
+        module.__path__[:] = [os.path.abspath(path) for path in module.__path__]
+
+from dAmnViper.parse import Packet
+from slate.config import Settings
+from slate.core import Bot
+from slate import startup
+
+
+class TestCommands(unittest.TestCase):
+    
+    lazy = False
+    
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.folder = tempfile.mkdtemp()
+        os.chdir(self.folder)
+        os.mkdir('storage')
+        
+        settings = Settings()
+        settings.extensions['lazy'] = self.lazy
+        settings.save()
+        
+        self.bot = bot = Bot.__new__(Bot)
+        bot.write = lambda *args, **kwargs: None
+        bot.populate_objects()
+        bot.log.start()
+        bot.client.owner = 'Owner'
+        bot.client.trigger = '!'
+        bot.client.inbound.clock = self.clock = Clock()
+        bot.users.load(owner='Owner')
+        
+        self.sent = []
+        bot.client.send = self.sent.append
+        bot.client.handle_pkt(Packet('join chat:Botdom\ne=ok\n\n'), 0)
+        self.clock.advance(0)
+    
+    def tearDown(self):
+        self.bot.teardown()
+        os.chdir(self.cwd)
+        shutil.rmtree(self.folder)
+    
+    def command(self, message):
+        """ Send a command as the owner, and return the replies. """
+        self.sent[:] = []
+        self.bot.client.handle_pkt(Packet('recv chat:Botdom\n\nmsg main\nfrom=Owner\n\n!' + message), 0)
+        self.clock.advance(0)
+        return [packet.split('\n\n', 2)[-1] for packet in self.sent]
+    
+    def test_timings(self):
+        self.assertEqual(self.command('timings on'), ['Owner: Recording pipeline timings.'])
+        self.assertTrue(self.bot.timings is not None)
+        self.assertTrue(self.bot.client.timer is self.bot.timings)
+        
+        self.assertEqual(self.command('timings reset'), ['Owner: Timings reset.'])
+        self.assertEqual(self.command('timings dump'), ['Owner: Timings written to <code>storage/timings.txt</code>.'])
+        self.assertTrue(os.path.exists('storage/timings.txt'))
+        
+        self.assertEqual(self.command('timings off'), ['Owner: No longer recording pipeline timings.'])
+        self.assertTrue(self.bot.client.timer is None)
+    
+    def test_timings_period(self):
+        self.command('timings on 60')
+        self.assertEqual(self.bot.timings_task.interval, 60)
+    
+    def test_profile(self):
+        self.assertEqual(self.command('profile on'), ['Owner: Profiling event handlers.'])
+        self.assertTrue(self.bot.profile is not None)
+        
+        self.command('about')
+        report = self.command('profile')[0]
+        self.assertTrue("<event['command:about'].binding>: 1 calls" in report)
+        
+        self.assertEqual(self.command('profile reset'), ['Owner: Profile reset.'])
+        self.assertEqual(self.command('profile dump'), ['Owner: Profile written to <code>storage/profile.txt</code>.'])
+        self.assertTrue(os.path.exists('storage/profile.txt'))
+        
+        self.assertEqual(self.command('profile off'), ['Owner: No longer profiling event handlers.'])
+    
+    def test_profile_period(self):
+        self.command('profile on 30')
+        self.assertEqual(self.bot.profile_task.interval, 30)
+
+    def test_queue_weight(self):
+        self.assertEqual(self.command('queue weight #Botdom 3'), ['Owner: Weight for #Botdom set to 3.0.'])
+        self.assertEqual(self.bot.client.inbound.lanes['#botdom'].weight, 3)
+        self.assertEqual(self.bot.config.inbound['weights'], {'#botdom': 3})
+        
+        report = self.command('queue')[0]
+        self.assertTrue('#botdom (weight 3.0)' in report)
+    
+    def test_queue_weight_usage(self):
+        self.assertEqual(self.command('queue weight #Botdom none'), ['Owner: Usage: <code>queue weight '
+            '#channel weight</code>, with a weight greater than 0.'])
+    
+    def test_startup_profile(self):
+        profiler = startup.StartupProfiler()
+        profiler.install()
+        startup.profiler = profiler
+        
+        try:
+            self.bot.profiled()
+            self.assertNotEqual(__builtin__.__import__, profiler.hook)
+            self.assertEqual(profiler.marks[-1][0], 'reactor running')
+            
+            # Stopping the profiler again does not write another report.
+            self.bot.profiled('shutting down')
+            with open('storage/startup-history.txt') as file:
+                self.assertEqual(len(file.readlines()), 1)
+            with open('storage/startup.txt') as file:
+                self.assertTrue('reactor running' in file.read())
+        finally:
+            profiler.uninstall()
+            startup.profiler = None
+
+
+class TestLazyCommands(TestCommands):
+    
+    lazy = True
+    
+    def test_command_loads_extension(self):
+        self.assertTrue('extensions.dAmn' in self.bot.exts.sleeping)
+        
+        self.assertEqual(self.command('join #Test'), ['join chat:Test\n'])
+        self.assertFalse('extensions.dAmn' in self.bot.exts.sleeping)
+        self.assertEqual(self.command('join #Other'), ['join chat:Other\n'])
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+# EOF
@@ -0,0 +1,64 @@
+''' tests.test_tasks
+    Tests for the task scheduler.
+'''
+
+import unittest
+from twisted.internet.task import Clock
+
+from dAmnViper.tasks import Scheduler
+
+
+class Owner(object):
+    pass
+
+
+class TestCancelOwner(unittest.TestCase):
+    
+    def setUp(self):
+        self.clock = Clock()
+        self.scheduler = Scheduler(self.clock)
+        self.scheduler.start()
+        self.owner = Owner()
+        self.calls = []
+    
+    def every(self, name, interval=1):
+        task = self.scheduler.call_every(interval, self.calls.append, name)
+        task.owner = self.owner
+        return task
+    
+    def test_running_task(self):
+        task = self.scheduler.call_every(1, self.scheduler.cancel_owner, self.owner)
+        task.owner = self.owner
+        
+        self.clock.advance(1)
+        self.clock.advance(1)
+        
+        self.assertEqual(task.calls, 1)
+        self.assertFalse(task.active())
+        self.assertEqual(len(self.scheduler), 0)
+    
+    def test_task_due_in_same_batch(self):
+        self.scheduler.call_every(1, self.scheduler.cancel_owner, self.owner)
+        task = self.every('later')
+        
+        self.clock.advance(1)
+        self.clock.advance(1)
+        
+        self.assertEqual(self.calls, [])
+        self.assertFalse(task.active())
+    
+    def test_other_owners(self):
+        task = self.scheduler.call_every(1, self.calls.append, 'other')
+        self.every('mine')
+        self.scheduler.cancel_owner(self.owner)
+        
+        self.clock.advance(1)
+        
+        self.assertEqual(self.calls, ['other'])
+        self.assertTrue(task.active())
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+# EOF
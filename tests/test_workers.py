@@ -0,0 +1,108 @@
+''' tests.test_workers
+    Tests for the worker pools.
+'''
+
+import os
+import sys
+import time
+import shutil
+import pkgutil
+import tempfile
+import cPickle
+import unittest
+from twisted.internet.task import Clock
+
+from reflex.data import Binding
+from slate import workers
+from slate.rules.command import data
+
+
+class Echo(object):
+    """ Stands in for a reactor. """
+    
+    name = 'Echo'
+    
+    def handler(self, event, dAmn):
+        dAmn.say(event.ns, event.message)
+
+
+class Idle(object):
+    """ Stands in for a pool whose workers never finish. """
+    
+    def apply_async(self, func, args, callback=None):
+        pass
+
+
+class TestProcessPool(unittest.TestCase):
+    
+    def setUp(self):
+        self.command = data.Command('command', {'ns': 'chat:botdom', 'message': 'hello'},
+            {'trigger': 'echo', 'message': 'hello world'})
+    
+    def test_command_pickles_after_rules_reload(self):
+        # The ruleset battery runs the module again, replacing the class.
+        pkgutil.find_loader(data.__name__).load_module(data.__name__)
+        
+        copy = cPickle.loads(cPickle.dumps(self.command, cPickle.HIGHEST_PROTOCOL))
+        self.assertTrue(isinstance(copy, data.Command))
+        self.assertEqual(copy.arguments(1), 'world')
+    
+    def test_reactor_method(self):
+        echo = Echo()
+        path = workers.target(echo.handler)
+        self.assertEqual(path, (__name__, 'Echo', 'handler'))
+        
+        calls, tb = workers.run_handler(*path + (self.command,))
+        self.assertEqual((calls, tb), ([('say', ('chat:botdom', 'hello world'), {})], None))
+    
+    def test_expired_job(self):
+        clock = Clock()
+        original = workers.reactor
+        workers.reactor = clock
+        
+        try:
+            echo = Echo()
+            pool = workers.ProcessPool(timeout=10)
+            pool.pool = Idle()
+            results = []
+            d = pool.submit(Binding(echo.handler, 'command', {}), self.command, ())
+            d.addCallback(results.append)
+            
+            self.assertEqual(pool.pending, 1)
+            clock.advance(10)
+            self.assertEqual((pool.pending, pool.failed, results), (0, 1, [None]))
+        finally:
+            workers.reactor = original
+    
+    def test_unstarted_pool_runs_handler_directly(self):
+        pool = workers.ProcessPool()
+        result = pool.submit(Binding(lambda data: data.trigger, 'command', {}), self.command, ())
+        self.assertEqual((result, pool.pending), ('echo', 0))
+    
+    def test_worker_reloads_changed_module(self):
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'workermod.py')
+        sys.path.insert(0, directory)
+        
+        try:
+            with open(path, 'w') as fd:
+                fd.write('value = 1\n')
+            workers.prepare()
+            self.assertEqual(workers.current('workermod').value, 1)
+            
+            with open(path, 'w') as fd:
+                fd.write('value = 2\n')
+            os.utime(path, (time.time() + 10, time.time() + 10))
+            self.assertEqual(workers.current('workermod').value, 2)
+        finally:
+            sys.path.remove(directory)
+            sys.modules.pop('workermod', None)
+            workers.loaded.clear()
+            workers.started = None
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+# EOF